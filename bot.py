@@ -4,20 +4,49 @@
 
 
 import os
+import multiprocessing
 from plugins.config import Config
+from plugins.database.database import db
+from plugins.functions.http_client import start_http, close_http
+from plugins.functions.ytdl_pool import close_ytdl
+from plugins.functions.broadcaster import resume_broadcasts
+from plugins.functions.verify import load_verifications
+from plugins.functions.log_shipper import shipper
 from pyrogram import Client
 
-if not os.path.isdir(Config.DOWNLOAD_LOCATION):
-    os.makedirs(Config.DOWNLOAD_LOCATION)
-
-plugins = dict(root="plugins")
-Client = Client("@UploaderXNTBot",
-    bot_token=Config.BOT_TOKEN,
-    api_id=Config.API_ID,
-    api_hash=Config.API_HASH,
-    upload_boost=True,
-    sleep_threshold=300,
-    plugins=plugins)
+
+class Bot(Client):
+
+    async def start(self):
+        await super().start()
+        await db.ensure_indexes()
+        await start_http()
+        await load_verifications()
+        shipper.start(self)
+        await resume_broadcasts(self)
+
+    async def stop(self, *args, **kwargs):
+        await shipper.stop()
+        await close_http()
+        await close_ytdl()
+        return await super().stop(*args, **kwargs)
+
+# The yt-dlp workers are spawned processes that import the entry module
+# (bot.py or app.py) again, only the real bot process builds a client.
+if multiprocessing.parent_process() is None:
+    if not os.path.isdir(Config.DOWNLOAD_LOCATION):
+        os.makedirs(Config.DOWNLOAD_LOCATION)
+
+    plugins = dict(root="plugins")
+    Client = Bot("@UploaderXNTBot",
+        bot_token=Config.BOT_TOKEN,
+        api_id=Config.API_ID,
+        api_hash=Config.API_HASH,
+        upload_boost=True,
+        sleep_threshold=300,
+        plugins=plugins)
+else:
+    Client = None
 
 if __name__ == "__main__":
     print("🎊 I AM ALIVE 🎊  • Support @NT_BOTS_SUPPORT")
@@ -13,9 +13,16 @@ from plugins.config import Config
 from plugins.script import Translation
 from plugins.thumbnail import *
 from plugins.functions.display_progress import progress_for_pyrogram, humanbytes
+from plugins.functions.progress_editor import cancel_message_progress
 from plugins.database.database import db
 from PIL import Image
 from plugins.functions.ran_text import random_char
+from plugins.functions import ytdl_pool
+from plugins.functions.ytdl_pool import YtdlError
+from plugins.functions.jobs import cancel_markup, set_stage, track_path
+from plugins.functions import media_cache
+from plugins.functions.thumb_cache import release_thumb
+from plugins.functions.help_Nekmo_ffmpeg import extract_audio
 cookies_file = 'cookies.txt'
 # Set up logging
 logging.basicConfig(level=logging.DEBUG,
@@ -76,16 +83,33 @@ async def youtube_dl_call_back(bot, update):
                 l = entity.length
                 youtube_dl_url = youtube_dl_url[o:o + l]
 
-    await update.message.edit_caption(
-        caption=Translation.DOWNLOAD_START.format(custom_file_name)
-    )
-    
     description = Translation.CUSTOM_CAPTION_UL_FILE
     if "fulltitle" in response_json:
         description = response_json["fulltitle"][0:1021]
+
+    upload_as_doc = await db.get_upload_as_doc(update.from_user.id)
+    send_type = media_cache.send_type_of(tg_send_type, upload_as_doc)
+    # Renamed and logged-in downloads are personal, only plain links are shared.
+    # A cached file_id also carries its uploader's thumbnail, so custom ones stay out.
+    cacheable = "|" not in update.message.reply_to_message.text and await media_cache.shareable(update.from_user.id)
+    link_key = media_cache.url_key(youtube_dl_url, youtube_dl_format, send_type) if cacheable else None
+    if link_key and await media_cache.send_cached(bot, update, link_key, description):
+        try:
+            os.remove(save_ytdl_json_path)
+        except FileNotFoundError:
+            pass
+        await update.message.edit_caption(caption=Translation.CACHED_UPLOAD)
+        return True
+
+    set_stage("downloading")
+    await update.message.edit_caption(
+        caption=Translation.DOWNLOAD_START.format(custom_file_name),
+        reply_markup=cancel_markup()
+    )
     
     tmp_directory_for_each_user = os.path.join(Config.DOWNLOAD_LOCATION, f"{update.from_user.id}{random1}")
     os.makedirs(tmp_directory_for_each_user, exist_ok=True)
+    track_path(tmp_directory_for_each_user)
     download_directory = os.path.join(tmp_directory_for_each_user, custom_file_name)
     
     command_to_exec = [
@@ -102,6 +126,7 @@ async def youtube_dl_call_back(bot, update):
     ]
     
     if tg_send_type == "audio":
+        # yt-dlp only fetches the audio, converting it takes a slot in the ffmpeg pool
         command_to_exec = [
             "yt-dlp",
             "-c",
@@ -110,11 +135,9 @@ async def youtube_dl_call_back(bot, update):
             "--extractor-args", "youtube:player_client=ios,web",
             "--max-filesize", str(Config.TG_MAX_FILE_SIZE),
             "--bidi-workaround",
-            "--extract-audio",
-            "--audio-format", youtube_dl_ext,
-            "--audio-quality", youtube_dl_format,
+            "-f", "bestaudio/best",
             youtube_dl_url,
-            "-o", download_directory
+            "-o", os.path.join(tmp_directory_for_each_user, "source.%(ext)s")
         ]
     
     if Config.HTTP_PROXY:
@@ -129,141 +152,145 @@ async def youtube_dl_call_back(bot, update):
     logger.info(command_to_exec)
     start = datetime.now()
     
-    process = await asyncio.create_subprocess_exec(
-        *command_to_exec,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
-    logger.info(e_response)
-    logger.info(t_response)
-    
-    if process.returncode != 0:
-        logger.error(f"yt-dlp command failed with return code {process.returncode}")
+    try:
+        await ytdl_pool.download(command_to_exec[1:])
+    except YtdlError as e:
+        e_response = str(e).strip()
+        logger.error(f"yt-dlp download failed: {e_response}")
+        ad_string_to_replace = "**Invalid link !**"
+        if ad_string_to_replace in e_response:
+            e_response = e_response.replace(ad_string_to_replace, "")
         await update.message.edit_caption(
             caption=f"Error: {e_response}"
         )
         return False
-    
-    ad_string_to_replace = "**Invalid link !**"
-    if e_response and ad_string_to_replace in e_response:
-        error_message = e_response.replace(ad_string_to_replace, "")
-        await update.message.edit_caption(
-            text=error_message
-        )
-        return False
 
-    if t_response:
-        logger.info(t_response)
-        try:
-            os.remove(save_ytdl_json_path)
-        except FileNotFoundError:
-            pass
-        
-        end_one = datetime.now()
-        time_taken_for_download = (end_one - start).seconds
-        
+    if tg_send_type == "audio":
+        sources = [
+            os.path.join(tmp_directory_for_each_user, name)
+            for name in os.listdir(tmp_directory_for_each_user) if name.startswith("source.")
+        ]
+        if sources:
+            await extract_audio(sources[0], download_directory, youtube_dl_ext, youtube_dl_format)
+            os.remove(sources[0])
+
+    try:
+        os.remove(save_ytdl_json_path)
+    except FileNotFoundError:
+        pass
+    
+    end_one = datetime.now()
+    time_taken_for_download = (end_one - start).seconds
+    
+    if os.path.isfile(download_directory):
+        file_size = os.stat(download_directory).st_size
+    else:
+        download_directory = os.path.splitext(download_directory)[0] + "." + ".mkv"
         if os.path.isfile(download_directory):
             file_size = os.stat(download_directory).st_size
         else:
-            download_directory = os.path.splitext(download_directory)[0] + "." + ".mkv"
-            if os.path.isfile(download_directory):
-                file_size = os.stat(download_directory).st_size
-            else:
-                logger.error(f"Downloaded file not found: {download_directory}")
-                await update.message.edit_caption(
-                    caption=Translation.DOWNLOAD_FAILED
-                )
-                return False
-        
-        if file_size > Config.TG_MAX_FILE_SIZE:
-            await update.message.edit_caption(
-                caption=Translation.RCHD_TG_API_LIMIT.format(time_taken_for_download, humanbytes(file_size))
-            )
-        else:
+            logger.error(f"Downloaded file not found: {download_directory}")
             await update.message.edit_caption(
-                caption=Translation.UPLOAD_START.format(custom_file_name)
+                caption=Translation.DOWNLOAD_FAILED
             )
-            start_time = time.time()
-            if not await db.get_upload_as_doc(update.from_user.id):
-                thumbnail = await Gthumb01(bot, update)
-                await update.message.reply_document(
-                    document=download_directory,
-                    thumb=thumbnail,
-                    caption=description,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        Translation.UPLOAD_START,
-                        update.message,
-                        start_time
-                    )
+            return False
+    
+    if file_size > Config.TG_MAX_FILE_SIZE:
+        await update.message.edit_caption(
+            caption=Translation.RCHD_TG_API_LIMIT.format(time_taken_for_download, humanbytes(file_size))
+        )
+    else:
+        content_key = None
+        if cacheable:
+            # Another link to the same bytes may have been uploaded already
+            content_key = media_cache.hash_key(await media_cache.file_digest(download_directory), send_type)
+            if await media_cache.send_cached(bot, update, content_key, description, [link_key]):
+                shutil.rmtree(tmp_directory_for_each_user, ignore_errors=True)
+                await update.message.edit_caption(caption=Translation.CACHED_UPLOAD)
+                return True
+        await update.message.edit_caption(
+            caption=Translation.UPLOAD_START.format(custom_file_name)
+        )
+        start_time = time.time()
+        if not upload_as_doc:
+            thumbnail = await Gthumb01(bot, update)
+            sent = await update.message.reply_document(
+                document=download_directory,
+                thumb=thumbnail,
+                caption=description,
+                progress=progress_for_pyrogram,
+                progress_args=(
+                    Translation.UPLOAD_START,
+                    update.message,
+                    start_time
                 )
-            else:
-                width, height, duration = await Mdata01(download_directory)
-                thumb_image_path = await Gthumb02(bot, update, duration, download_directory)
-                await update.message.reply_video(
-                    video=download_directory,
-                    caption=description,
-                    duration=duration,
-                    width=width,
-                    height=height,
-                    supports_streaming=True,
-                    thumb=thumb_image_path,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        Translation.UPLOAD_START,
-                        update.message,
-                        start_time
-                    )
+            )
+        else:
+            width, height, duration = await Mdata01(download_directory)
+            thumb_image_path = await Gthumb02(bot, update, duration, download_directory)
+            sent = await update.message.reply_video(
+                video=download_directory,
+                caption=description,
+                duration=duration,
+                width=width,
+                height=height,
+                supports_streaming=True,
+                thumb=thumb_image_path,
+                progress=progress_for_pyrogram,
+                progress_args=(
+                    Translation.UPLOAD_START,
+                    update.message,
+                    start_time
                 )
-            
-            if tg_send_type == "audio":
-                duration = await Mdata03(download_directory)
-                thumbnail = await Gthumb01(bot, update)
-                await update.message.reply_audio(
-                    audio=download_directory,
-                    caption=description,
-                    duration=duration,
-                    thumb=thumbnail,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        Translation.UPLOAD_START,
-                        update.message,
-                        start_time
-                    )
+            )
+        
+        if tg_send_type == "audio":
+            duration = await Mdata03(download_directory)
+            thumbnail = await Gthumb01(bot, update)
+            sent = await update.message.reply_audio(
+                audio=download_directory,
+                caption=description,
+                duration=duration,
+                thumb=thumbnail,
+                progress=progress_for_pyrogram,
+                progress_args=(
+                    Translation.UPLOAD_START,
+                    update.message,
+                    start_time
                 )
-            elif tg_send_type == "vm":
-                width, duration = await Mdata02(download_directory)
-                thumbnail = await Gthumb02(bot, update, duration, download_directory)
-                await update.message.reply_video_note(
-                    video_note=download_directory,
-                    duration=duration,
-                    length=width,
-                    thumb=thumbnail,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        Translation.UPLOAD_START,
-                        update.message,
-                        start_time
-                    )
+            )
+        elif tg_send_type == "vm":
+            width, duration = await Mdata02(download_directory)
+            thumbnail = await Gthumb02(bot, update, duration, download_directory)
+            sent = await update.message.reply_video_note(
+                video_note=download_directory,
+                duration=duration,
+                length=width,
+                thumb=thumbnail,
+                progress=progress_for_pyrogram,
+                progress_args=(
+                    Translation.UPLOAD_START,
+                    update.message,
+                    start_time
                 )
-            else:
-                logger.info("✅ " + custom_file_name)
-            
-            end_two = datetime.now()
-            time_taken_for_upload = (end_two - end_one).seconds
-            try:
-                shutil.rmtree(tmp_directory_for_each_user)
-                os.remove(thumbnail)
-            except Exception as e:
-                logger.error(f"Error cleaning up: {e}")
-            
-            await update.message.edit_caption(
-                caption=Translation.AFTER_SUCCESSFUL_UPLOAD_MSG_WITH_TS.format(time_taken_for_download, time_taken_for_upload)
             )
-            
-            logger.info(f"✅ Downloaded in: {time_taken_for_download} seconds")
-            logger.info(f"✅ Uploaded in: {time_taken_for_upload} seconds")
+        else:
+            logger.info("✅ " + custom_file_name)
+        if cacheable:
+            await media_cache.remember([link_key, content_key], sent)
+        
+        end_two = datetime.now()
+        time_taken_for_upload = (end_two - end_one).seconds
+        try:
+            shutil.rmtree(tmp_directory_for_each_user)
+            release_thumb(thumbnail)
+        except Exception as e:
+            logger.error(f"Error cleaning up: {e}")
+        
+        await cancel_message_progress(update.message)
+        await update.message.edit_caption(
+            caption=Translation.AFTER_SUCCESSFUL_UPLOAD_MSG_WITH_TS.format(time_taken_for_download, time_taken_for_upload)
+        )
+        
+        logger.info(f"✅ Downloaded in: {time_taken_for_download} seconds")
+        logger.info(f"✅ Uploaded in: {time_taken_for_upload} seconds")
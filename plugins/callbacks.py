@@ -3,6 +3,10 @@ from plugins.functions.display_progress import progress_for_pyrogram, humanbytes
 from plugins.config import Config
 from plugins.dl_button import ddl_call_back
 from plugins.button import youtube_dl_call_back
+from plugins.functions.scheduler import scheduler, queue_notice
+from plugins.functions.jobs import start_job
+from plugins.functions.thumb_cache import forget_thumb
+from plugins.functions.forcesub import membership, get_invite_link, BANNED, MISSING
 from plugins.settings.settings import OpenSettings
 from plugins.script import Translation
 from pyrogram import Client, types
@@ -34,34 +38,30 @@ async def button(bot, update):
         )
     elif "refreshForceSub" in update.data:
         if Config.UPDATES_CHANNEL:
-            if str(Config.UPDATES_CHANNEL).startswith("-100"):
-                channel_chat_id = int(Config.UPDATES_CHANNEL)
-            else:
-                channel_chat_id = Config.UPDATES_CHANNEL
             try:
-                user = await bot.get_chat_member(channel_chat_id, update.message.chat.id)
-                if user.status == "kicked":
+                # The user says they joined, so don't trust the cached answer
+                status = await membership(bot, update.from_user.id, fresh=True)
+                if status == BANNED:
                     await update.message.edit(
                         text="Sorry Sir, You are Banned.",
                         disable_web_page_preview=True
                     )
                     return
-            except UserNotParticipant:
-                chat_id = channel_chat_id
-                await update.message.edit(
-                    text="**I like Your Smartness But Don't Be Oversmart! 😑**\n\n",
-                    reply_markup=InlineKeyboardMarkup(
-                        [
-                            [
-                                InlineKeyboardButton("🤖 Join Updates Channel", url=invite_link.invite_link)
-                            ],
+                if status == MISSING:
+                    await update.message.edit(
+                        text="**I like Your Smartness But Don't Be Oversmart! 😑**\n\n",
+                        reply_markup=InlineKeyboardMarkup(
                             [
-                                InlineKeyboardButton("🔄 Refresh 🔄", callback_data="refreshForceSub")
+                                [
+                                    InlineKeyboardButton("🤖 Join Updates Channel", url=await get_invite_link(bot))
+                                ],
+                                [
+                                    InlineKeyboardButton("🔄 Refresh 🔄", callback_data="refreshForceSub")
+                                ]
                             ]
-                        ]
+                        )
                     )
-                )
-                return
+                    return
             except Exception:
                 await update.message.edit(
                     text="Something Went Wrong. Try again later",
@@ -87,6 +87,7 @@ async def button(bot, update):
                                                               callback_data="deleteThumbnail")
                                ]]))
     elif update.data == "deleteThumbnail":
+        forget_thumb(await db.get_thumbnail(update.from_user.id))
         await db.set_thumbnail(update.from_user.id, None)
         await update.answer("Okay, I deleted your custom thumbnail. Now I will apply default thumbnail.", show_alert=True)
         await update.message.delete(True)
@@ -127,9 +128,21 @@ async def button(bot, update):
         await update.message.delete(True)
 
     elif "|" in update.data:
-        await youtube_dl_call_back(bot, update)
+        start_job(queued_job(bot, update, youtube_dl_call_back), "yt-dlp", update.from_user.id, job_title(update))
     elif "=" in update.data:
-        await ddl_call_back(bot, update)
+        start_job(queued_job(bot, update, ddl_call_back), "direct", update.from_user.id, job_title(update))
 
     else:
         await update.message.delete()
+
+
+async def queued_job(bot, update, job):
+    async with scheduler.slot(update.from_user.id, queue_notice(update.message)):
+        await job(bot, update)
+
+
+def job_title(update):
+    link = update.message.reply_to_message
+    if link is not None and link.text:
+        return link.text.split(" * ")[0][:200]
+    return update.data
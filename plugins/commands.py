@@ -16,10 +16,13 @@ from pyrogram import Client, filters
 from plugins.database.add import AddUser
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from plugins.database.database import db
-from plugins.functions.forcesub import handle_force_subscribe
+from plugins.functions.forcesub import handle_force_subscribe, on_member_updated, channel_id
 from plugins.settings.settings import OpenSettings
 from plugins.config import *
-from plugins.functions.verify import verify_user, check_token
+from plugins.functions.verify import verify_user
+from plugins.functions.jobs import get_job, list_jobs
+from plugins.functions.progress_editor import finish_message_progress
+from plugins.functions.scheduler import scheduler
 from pyrogram import types, errors
 
 
@@ -47,13 +50,11 @@ async def start(bot, update):
                 text="<b>Exᴘɪʀᴇᴅ Lɪɴᴋ Oʀ ⵊɴᴠᴀʟɪᴅ Lɪɴᴋ !</b>",
                 protect_content=True
             )
-        is_valid = await check_token(bot, userid, token)
-        if is_valid == True:
+        if await verify_user(bot, userid, token):
             await update.reply_text(
                 text=f"<b>Hᴇʏ {update.from_user.mention} 👋,\nʏᴏᴜ Aʀᴇ Sᴜᴄᴄᴇssғᴜʟʟʏ Vᴇʀɪғɪᴇᴅ !\n\nNᴏᴡ Yᴏᴜ Uᴘʟᴏᴀᴅ Fɪʟᴇs Aɴᴅ Vɪᴅᴇᴏs Tɪʟʟ Tᴏᴅᴀʏ Mɪᴅɴɪɢʜᴛ.</b>",
                 protect_content=True
             )
-            await verify_user(bot, userid, token)
         else:
             return await update.reply_text(
                 text="<b>Exᴘɪʀᴇᴅ Lɪɴᴋ Oʀ ⵊɴᴠᴀʟɪᴅ Lɪɴᴋ !</b>",
@@ -62,6 +63,13 @@ async def start(bot, update):
 
 
 
+if Config.UPDATES_CHANNEL:
+    # Joins and leaves in the updates channel refresh the force-subscribe cache, needs the bot to be admin there
+    @Client.on_chat_member_updated(filters.chat(channel_id()))
+    async def updates_channel_member(bot, update):
+        await on_member_updated(bot, update)
+
+
 @Client.on_message(filters.command("help", [".", "/"]) & filters.private)
 async def help_bot(_, m: Message):
     await AddUser(_, m)
@@ -110,15 +118,57 @@ async def add_caption_help(bot, update):
     )
 
 
-@Client.on_callback_query(filters.regex(r'^cancel_download\+'))
+# Runs ahead of the catch-all callback handler, which would otherwise delete the message
+@Client.on_callback_query(filters.regex(r'^cancel_download\+'), group=-1)
 async def cancel_cb(c, m):
-    await m.answer()
-    await m.message.edit(text="Trying to Cancel")
-    id = m.data.split("+", 1)[1]
-    if id not in Config.DOWNLOAD_LOCATION:
-        await m.message.edit("This process already cancelled reason may be bot restarted")
+    job = get_job(m.data.split("+", 1)[1])
+    if job is None:
+        await m.answer("This process already finished or was cancelled, reason may be bot restarted", show_alert=True)
+    elif m.from_user.id not in (job.user_id, Config.OWNER_ID):
+        await m.answer("This is not your task.", show_alert=True)
+    else:
+        job.cancel()
+        await m.answer("Cancelling...")
+        await finish_message_progress(m.message, f"⛔ Cancelled `{job.id}`")
+    m.stop_propagation()
+
+
+@Client.on_message(filters.private & filters.command("jobs"))
+async def jobs_handler(c, m):
+    """/jobs lists running tasks, /jobs <id> shows one of them"""
+    is_owner = m.from_user.id == Config.OWNER_ID
+    if len(m.command) > 1:
+        job = get_job(m.command[1])
+        if job is None or not (is_owner or job.user_id == m.from_user.id):
+            await m.reply_text("No such task, it may have finished already.")
+            return
+        await m.reply_text(
+            job.describe(),
+            reply_markup=InlineKeyboardMarkup(
+                [[InlineKeyboardButton('⛔ Cancel', callback_data=f"cancel_download+{job.id}")]]
+            ),
+            disable_web_page_preview=True
+        )
+        return
+    running = list_jobs(None if is_owner else m.from_user.id)
+    text = "\n\n".join(job.describe() for job in running) or "No running tasks."
+    if is_owner:
+        stats = scheduler.stats()
+        text += f"\n\nSlots: {stats['running']}/{stats['slots']} busy, {stats['queued']} queued"
+    await m.reply_text(text[:4096], disable_web_page_preview=True)
+
+
+@Client.on_message(filters.private & filters.command("cancel"))
+async def cancel_handler(c, m):
+    if len(m.command) < 2:
+        await m.reply_text("Usage: /cancel <task id>, see /jobs for the ids.")
+        return
+    job = get_job(m.command[1])
+    if job is None or m.from_user.id not in (job.user_id, Config.OWNER_ID):
+        await m.reply_text("No such task, it may have finished already.")
         return
-    Config.DOWNLOAD_LOCATION.remove(id)
+    job.cancel()
+    await m.reply_text(f"⛔ Cancelled `{job.id}`")
 
 
 @Client.on_message(filters.private & filters.command("info", [".", "/"]))
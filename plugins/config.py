@@ -20,8 +20,23 @@ class Config(object):
     TG_MAX_FILE_SIZE = 2194304000
     FREE_USER_MAX_FILE_SIZE = 2194304000
     CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 128))
+    # Parallel Range connections per direct download, 1 disables segmenting
+    DOWNLOAD_SEGMENTS = int(os.environ.get("DOWNLOAD_SEGMENTS", 4))
+    SEGMENT_MIN_SIZE = int(os.environ.get("SEGMENT_MIN_SIZE", 10 * 1024 * 1024))
+    DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", 5))
+    # Partial-download journals, kept beside the downloads so they survive restarts
+    RESUME_JOURNAL_DIR = "./DOWNLOADS_JOURNAL"
+    # Feed documents into the Telegram upload while they download, nothing touches the disk.
+    # Memory per upload is STREAM_BUFFER_PARTS parts of 512 KiB.
+    STREAM_UPLOAD = os.environ.get("STREAM_UPLOAD", "").lower() == "true"
+    STREAM_BUFFER_PARTS = int(os.environ.get("STREAM_BUFFER_PARTS", 16))
+    STREAM_UPLOAD_WORKERS = int(os.environ.get("STREAM_UPLOAD_WORKERS", 4))
     DEF_THUMB_NAIL_VID_S = os.environ.get("DEF_THUMB_NAIL_VID_S", "https://placehold.it/90x90")
     HTTP_PROXY = os.environ.get("HTTP_PROXY", "")
+    # Shared aiohttp connection pool
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 100))
+    HTTP_PER_HOST_LIMIT = int(os.environ.get("HTTP_PER_HOST_LIMIT", 16))
+    HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))
     
     OUO_IO_API_KEY = ""
     MAX_MESSAGE_LENGTH = 4096
@@ -31,12 +46,63 @@ class Config(object):
     BANNED_USERS = set(int(x) for x in os.environ.get("BANNED_USERS", "").split())
 
     DATABASE_URL = os.environ.get("DATABASE_URL", "")
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 300))
+
+    # yt-dlp metadata cache for echo, the Mongo tier is shared between restarts
+    YTDL_CACHE_TTL = int(os.environ.get("YTDL_CACHE_TTL", 1800))
+    YTDL_CACHE_SIZE = int(os.environ.get("YTDL_CACHE_SIZE", 512))
+    YTDL_CACHE_MONGO = os.environ.get("YTDL_CACHE_MONGO", "").lower() == "true"
+    # Telegram file_ids of finished uploads, a repeat request is re-sent without downloading
+    MEDIA_CACHE_SIZE = int(os.environ.get("MEDIA_CACHE_SIZE", 2048))
+    # Resized custom thumbnails kept on disk, by Telegram file_id
+    THUMB_CACHE_SIZE = int(os.environ.get("THUMB_CACHE_SIZE", 1000))
+    # Warm yt-dlp worker processes shared by probes and downloads
+    YTDL_PROBE_WORKERS = int(os.environ.get("YTDL_PROBE_WORKERS", 2))
+    YTDL_DOWNLOAD_WORKERS = int(os.environ.get("YTDL_DOWNLOAD_WORKERS", 4))
+    YTDL_QUEUE_SIZE = int(os.environ.get("YTDL_QUEUE_SIZE", 50))
+    YTDL_PROBE_TIMEOUT = int(os.environ.get("YTDL_PROBE_TIMEOUT", 120))
+    SOCIAL_DL_WORKERS = int(os.environ.get("SOCIAL_DL_WORKERS", 4))
+    # Terabox: how long share listings and download links are reused, how many files one share can queue
+    TERABOX_LINK_TTL = int(os.environ.get("TERABOX_LINK_TTL", 3600))
+    TERABOX_CACHE_SIZE = int(os.environ.get("TERABOX_CACHE_SIZE", 1000))
+    TERABOX_MAX_FILES = int(os.environ.get("TERABOX_MAX_FILES", 50))
+    # Terabox endpoints/mirrors asked at once when resolving a link
+    TERABOX_HEDGE = int(os.environ.get("TERABOX_HEDGE", 3))
+    # ffmpeg processes at once (defaults to one per core) and the nice level they run at
+    FFMPEG_WORKERS = int(os.environ.get("FFMPEG_WORKERS", os.cpu_count() or 1))
+    FFMPEG_NICE = int(os.environ.get("FFMPEG_NICE", 10))
+
+    # Job scheduler: jobs running at once, bot-wide and per user
+    MAX_RUNNING_JOBS = int(os.environ.get("MAX_RUNNING_JOBS", 6))
+    MAX_JOBS_PER_USER = int(os.environ.get("MAX_JOBS_PER_USER", 2))
+    QUEUE_REFRESH_INTERVAL = 5
+
+    # Status message edits: seconds between edits of one message, bot-wide edit rate
+    PROGRESS_INTERVAL = int(os.environ.get("PROGRESS_INTERVAL", 5))
+    PROGRESS_EDITS_PER_SECOND = float(os.environ.get("PROGRESS_EDITS_PER_SECOND", 20))
+    PROGRESS_EDITS_BURST = int(os.environ.get("PROGRESS_EDITS_BURST", 30))
+
+    # Broadcast: parallel senders, messages per second before FloodWaits, users per checkpoint
+    BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 10))
+    BROADCAST_RATE = int(os.environ.get("BROADCAST_RATE", 25))
+    BROADCAST_BATCH = int(os.environ.get("BROADCAST_BATCH", 200))
 
     LOG_CHANNEL = int(os.environ.get("LOG_CHANNEL", ""))
+    # Log channel: entries waiting, entries per message, seconds a message waits to fill up,
+    # one in how many entries is kept once the queue is half full
+    LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 1000))
+    LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 20))
+    LOG_BATCH_INTERVAL = float(os.environ.get("LOG_BATCH_INTERVAL", 5))
+    LOG_SAMPLE_RATE = int(os.environ.get("LOG_SAMPLE_RATE", 10))
     LOGGER = logging
     OWNER_ID = int(os.environ.get("OWNER_ID", ""))
     SESSION_NAME = "UploaderXNTBot"
     UPDATES_CHANNEL = os.environ.get("UPDATES_CHANNEL", "")
+    # Force subscribe: seconds a membership answer is reused, members and non-members
+    FSUB_MEMBER_TTL = int(os.environ.get("FSUB_MEMBER_TTL", 600))
+    FSUB_NEGATIVE_TTL = int(os.environ.get("FSUB_NEGATIVE_TTL", 30))
+    FSUB_CACHE_SIZE = int(os.environ.get("FSUB_CACHE_SIZE", 10000))
 
     TG_MIN_FILE_SIZE = 2194304000
     BOT_USERNAME = os.environ.get("BOT_USERNAME", "")
@@ -49,6 +115,17 @@ class Config(object):
     SHORT_DOMAIN = environ.get("SHORT_DOMAIN", "")
     SHORT_API = environ.get("SHORT_API", "")
 
+    # Verification: how long a verify link stays valid, cached verified users, seconds a miss is trusted
+    VERIFY_TOKEN_TTL = int(os.environ.get("VERIFY_TOKEN_TTL", 86400))
+    VERIFY_CACHE_SIZE = int(os.environ.get("VERIFY_CACHE_SIZE", 10000))
+    VERIFY_NEGATIVE_TTL = int(os.environ.get("VERIFY_NEGATIVE_TTL", 300))
+
+    # Shortlinks: seconds to wait on the shortener, links waiting to be shortened,
+    # seconds before a token runs out that its cached link stops being handed out
+    SHORTLINK_TIMEOUT = int(os.environ.get("SHORTLINK_TIMEOUT", 10))
+    SHORTLINK_QUEUE_SIZE = int(os.environ.get("SHORTLINK_QUEUE_SIZE", 500))
+    SHORTLINK_MARGIN = int(os.environ.get("SHORTLINK_MARGIN", 600))
+
     # Verification video link
     VERIFICATION = os.environ.get("VERIFICATION", "")
 
@@ -6,6 +6,5 @@ from pyrogram.types import Message
 
 
 async def AddUser(bot: Client, update: Message):
-    if not await db.is_user_exist(update.from_user.id):
-           await db.add_user(update.from_user.id)
+    await db.ensure_user(update.from_user.id)
 
@@ -8,6 +8,10 @@ from plugins.config import Config
 from pyrogram import Client, enums
 from plugins.database.database import db
 from plugins.functions.display_progress import humanbytes
+from plugins.functions.ffmpeg_pool import pool as ffmpeg_pool
+from plugins.terabox import endpoint_stats
+from plugins.functions.preflight import stage_stats
+from plugins.functions.log_shipper import shipper
 from pyrogram import Client
 
 @Client.on_message(filters.private & filters.command('total'))
@@ -28,12 +32,23 @@ async def status_handler(_, m: Message):
     ram_usage = psutil.virtual_memory().percent
     disk_usage = psutil.disk_usage('/').percent
     total_users = await db.total_users_count()
+    cache = db.cache_stats()
+    ffmpeg = ffmpeg_pool.stats()
+    log_stats = shipper.stats()
     await m.reply_text(
         text=f"**Total Disk Space:** {total} \n"
              f"**Used Space:** {used}({disk_usage}%) \n"
              f"**Free Space:** {free} \n"
              f"**CPU Usage:** {cpu_usage}% \n"
              f"**RAM Usage:** {ram_usage}%\n\n"
-             f"**Total Users in DB:** `{total_users}`",
+             f"**Total Users in DB:** `{total_users}`\n"
+             f"**User Cache:** {cache['hits']} hits, {cache['misses']} misses, {cache['size']} cached\n"
+             f"**ffmpeg:** {ffmpeg['running']}/{ffmpeg['workers']} running, {ffmpeg['waiting']} waiting, "
+             f"{ffmpeg['completed']} done, {ffmpeg['failed']} failed, {ffmpeg['timed_out']} timed out, "
+             f"avg wait {ffmpeg['avg_wait']:.1f}s, avg run {ffmpeg['avg_run']:.1f}s\n"
+             f"**Terabox endpoints:** {endpoint_stats.summary()}\n"
+             f"**Link pre-flight:** {stage_stats.summary()}\n"
+             f"**Log channel:** {log_stats['sent']} sent, {log_stats['queued']} queued, "
+             f"{log_stats['sampled']} sampled out, {log_stats['dropped']} dropped",
         quote=True
     )
@@ -1,15 +1,31 @@
 # (c) @AbirHasan2005
 
 import datetime
+import json
+import logging
+import time
+from collections import OrderedDict
 import motor.motor_asyncio
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
 from plugins.config import Config
 
+logger = logging.getLogger(__name__)
+
 
 class Database:
     def __init__(self, uri, database_name):
         self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
         self.db = self._client[database_name]
         self.col = self.db.users
+        self.ytdl = self.db.ytdl_cache
+        self.bcast = self.db.broadcasts
+        self.media = self.db.media_cache
+        self.verified = self.db.verified_users
+        self.tokens = self.db.verify_tokens
+        self._users = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def new_user(self, id):
         return dict(
@@ -21,12 +37,82 @@ class Database:
             caption=None
         )
 
-    async def add_user(self, id):
+    # Write-through cache of user documents, a job reads its settings from
+    # here instead of doing one find_one per setting.
+
+    def _cached(self, id):
+        entry = self._users.get(id)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        self._users.move_to_end(id)
+        return True, entry[1]
+
+    def _remember(self, id, user):
+        self._users[id] = (time.monotonic() + Config.USER_CACHE_TTL, user)
+        self._users.move_to_end(id)
+        while len(self._users) > Config.USER_CACHE_SIZE:
+            self._users.popitem(last=False)
+
+    def forget_user(self, id):
+        self._users.pop(int(id), None)
+
+    async def _get_user(self, id):
+        id = int(id)
+        found, user = self._cached(id)
+        if found:
+            self.cache_hits += 1
+            return user
+        self.cache_misses += 1
+        user = await self.col.find_one({'id': id})
+        self._remember(id, user)
+        return user
+
+    async def _set_fields(self, id, fields):
+        id = int(id)
+        await self.col.update_one({'id': id}, {'$set': fields})
+        found, user = self._cached(id)
+        if found and user is not None:
+            user.update(fields)
+        else:
+            self.forget_user(id)
+
+    def cache_stats(self):
+        return dict(hits=self.cache_hits, misses=self.cache_misses, size=len(self._users))
+
+    async def ensure_indexes(self):
+        """Run once at startup, every lookup in here goes through users.id"""
+        try:
+            await self.col.create_index('id', unique=True)
+        except OperationFailure as e:
+            # Old duplicate rows block the unique index, still avoid the collection scan
+            logger.error(f"Unique index on users.id failed, using a plain one: {e}")
+            await self.col.create_index('id')
+        await self.ytdl.create_index('url', unique=True)
+        await self.ytdl.create_index('expires_at', expireAfterSeconds=0)
+        await self.verified.create_index('expires_at', expireAfterSeconds=0)
+        await self.tokens.create_index('expires_at', expireAfterSeconds=0)
+
+    async def ensure_user(self, id):
+        """Create the user if missing in a single upsert, returns True when it was new"""
+        id = int(id)
+        found, user = self._cached(id)
+        if found and user is not None:
+            return False
         user = self.new_user(id)
-        await self.col.insert_one(user)
+        before = await self.col.find_one_and_update(
+            {'id': id},
+            {'$setOnInsert': {k: v for k, v in user.items() if k != 'id'}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        self._remember(id, before or user)
+        return before is None
+
+    async def add_user(self, id):
+        await self.ensure_user(id)
 
     async def is_user_exist(self, id):
-        user = await self.col.find_one({'id': int(id)})
+        user = await self._get_user(id)
         return bool(user)
 
     async def total_users_count(self):
@@ -38,45 +124,122 @@ class Database:
 
     async def delete_user(self, user_id):
         await self.col.delete_many({'id': int(user_id)})
+        self.forget_user(user_id)
+
+    async def delete_users(self, user_ids):
+        user_ids = [int(i) for i in user_ids]
+        await self.col.delete_many({'id': {'$in': user_ids}})
+        for user_id in user_ids:
+            self.forget_user(user_id)
+
+    def get_users_after(self, last_id=None):
+        """Users in _id order, starting after last_id, for resumable walks"""
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        return self.col.find(query, {'id': 1}).sort('_id', 1)
 
     async def set_apply_caption(self, id, apply_caption):
-        await self.col.update_one({'id': id}, {'$set': {'apply_caption': apply_caption}})
+        await self._set_fields(id, {'apply_caption': apply_caption})
 
     async def get_apply_caption(self, id):
-        user = await self.col.find_one({'id': int(id)})
+        user = await self._get_user(id) or {}
         return user.get('apply_caption', True)
 
     async def set_upload_as_doc(self, id, upload_as_doc):
-        await self.col.update_one({'id': id}, {'$set': {'upload_as_doc': upload_as_doc}})
+        await self._set_fields(id, {'upload_as_doc': upload_as_doc})
 
     async def get_upload_as_doc(self, id):
-        user = await self.col.find_one({'id': int(id)})
+        user = await self._get_user(id) or {}
         return user.get('upload_as_doc', False)
 
     async def set_thumbnail(self, id, thumbnail):
-        await self.col.update_one({'id': id}, {'$set': {'thumbnail': thumbnail}})
+        await self._set_fields(id, {'thumbnail': thumbnail})
 
     async def get_thumbnail(self, id):
-        user = await self.col.find_one({'id': int(id)})
+        user = await self._get_user(id) or {}
         return user.get('thumbnail', None)
 
     async def set_terabox_cookie(self, id, cookie):
-        await self.col.update_one({'id': id}, {'$set': {'terabox_cookie': cookie}})
+        await self._set_fields(id, {'terabox_cookie': cookie})
 
     async def get_terabox_cookie(self, id):
-        user = await self.col.find_one({'id': int(id)})
+        user = await self._get_user(id) or {}
         return user.get('terabox_cookie', None)
 
     async def set_caption(self, id, caption):
-        await self.col.update_one({'id': id}, {'$set': {'caption': caption}})
+        await self._set_fields(id, {'caption': caption})
 
     async def get_caption(self, id):
-        user = await self.col.find_one({'id': int(id)})
+        user = await self._get_user(id) or {}
         return user.get('caption', None)
 
     async def get_user_data(self, id) -> dict:
-        user = await self.col.find_one({'id': int(id)})
-        return user or None
+        user = await self._get_user(id)
+        return dict(user) if user else None
+
+    async def save_broadcast(self, state):
+        await self.bcast.replace_one({'_id': state['_id']}, state, upsert=True)
+
+    async def get_running_broadcasts(self):
+        return await self.bcast.find({'status': 'running'}).to_list(length=None)
+
+    async def get_ytdl_info(self, url):
+        entry = await self.ytdl.find_one({'url': url, 'expires_at': {'$gt': datetime.datetime.utcnow()}})
+        return json.loads(entry['info']) if entry else None
+
+    async def set_ytdl_info(self, url, info, ttl):
+        # Stored as a JSON string, yt-dlp keys are not always valid Mongo field names
+        await self.ytdl.update_one(
+            {'url': url},
+            {'$set': {
+                'info': json.dumps(info, ensure_ascii=False),
+                'expires_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+            }},
+            upsert=True
+        )
+
+
+    async def get_media(self, key):
+        entry = await self.media.find_one({'_id': key})
+        return entry['file_id'] if entry else None
+
+    async def set_media(self, key, file_id):
+        await self.media.update_one(
+            {'_id': key},
+            {'$set': {'file_id': file_id, 'date': datetime.datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def delete_media(self, key):
+        await self.media.delete_one({'_id': key})
+
+    # Verification, both collections are keyed by user id and expire through their TTL index
+
+    async def get_verified_until(self, user_id):
+        entry = await self.verified.find_one(
+            {'_id': int(user_id), 'expires_at': {'$gt': datetime.datetime.utcnow()}}
+        )
+        return entry['expires_at'] if entry else None
+
+    async def set_verified_until(self, user_id, until):
+        await self.verified.update_one({'_id': int(user_id)}, {'$set': {'expires_at': until}}, upsert=True)
+
+    def get_verified_users(self):
+        return self.verified.find({'expires_at': {'$gt': datetime.datetime.utcnow()}})
+
+    async def set_verify_token(self, user_id, token, ttl):
+        # One live token per user, a new one replaces the last
+        await self.tokens.replace_one(
+            {'_id': int(user_id)},
+            {'token': token, 'expires_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)},
+            upsert=True
+        )
+
+    async def use_verify_token(self, user_id, token):
+        """Consume the token, True only for the first caller while it is still valid"""
+        entry = await self.tokens.find_one_and_delete(
+            {'_id': int(user_id), 'token': token, 'expires_at': {'$gt': datetime.datetime.utcnow()}}
+        )
+        return entry is not None
 
 
 db = Database(Config.DATABASE_URL, "UploadLinkToFileBot")
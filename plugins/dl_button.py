@@ -18,8 +18,13 @@ from plugins.thumbnail import *
 from plugins.database.database import db
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 from plugins.functions.display_progress import progress_for_pyrogram, humanbytes, TimeFormatter
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
+from plugins.functions.http_client import get_session
+from plugins.functions.progress_editor import push_progress, finish_progress, cancel_message_progress
+from plugins.functions.downloader import segmented_download, supports_ranges, validators_of
+from plugins.functions.jobs import cancel_markup, set_stage, track_path
+from plugins.functions import media_cache
+from plugins.functions.thumb_cache import release_thumb
+from plugins.functions.stream_upload import stream_to_telegram
 from PIL import Image
 from pyrogram import enums 
 
@@ -63,6 +68,55 @@ async def ddl_call_back(bot, update):
                 l = entity.length
                 youtube_dl_url = youtube_dl_url[o:o + l]
     description = Translation.CUSTOM_CAPTION_UL_FILE
+    upload_as_doc = await db.get_upload_as_doc(update.from_user.id)
+    send_type = media_cache.send_type_of(tg_send_type, upload_as_doc)
+    # Renamed downloads are personal, only plain links are shared.
+    # A cached file_id also carries its uploader's thumbnail, so custom ones stay out.
+    cacheable = "|" not in update.message.reply_to_message.text and await media_cache.shareable(update.from_user.id)
+    link_key = media_cache.url_key(youtube_dl_url, youtube_dl_format, send_type) if cacheable else None
+    if link_key and await media_cache.send_cached(bot, update, link_key, description):
+        await update.message.edit_caption(caption=Translation.CACHED_UPLOAD)
+        return True
+    if Config.STREAM_UPLOAD and send_type == "document":
+        set_stage("streaming")
+        await update.message.edit_caption(
+            caption=Translation.UPLOAD_START,
+            parse_mode=enums.ParseMode.HTML
+        )
+        start_time = time.time()
+        try:
+            streamed = await stream_to_telegram(
+                bot,
+                get_session(),
+                youtube_dl_url,
+                update.message.chat.id,
+                custom_file_name,
+                description,
+                thumb=await Gthumb01(bot, update),
+                parse_mode=enums.ParseMode.HTML,
+                progress=progress_for_pyrogram,
+                progress_args=(Translation.UPLOAD_START, update.message, start_time)
+            )
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            await cancel_message_progress(update.message)
+            await update.message.edit_caption(caption=Translation.SLOW_URL_DECED)
+            return False
+        except Exception as e:
+            # Telegram refused the parts or the media, the disk path may still work
+            logger.error(f"Streaming {youtube_dl_url} failed, downloading first: {e}")
+            await cancel_message_progress(update.message)
+            streamed = None
+        if streamed is not None:
+            sent, digest = streamed
+            if cacheable:
+                await media_cache.remember([link_key, media_cache.hash_key(digest, send_type)], sent)
+            await cancel_message_progress(update.message)
+            await update.message.edit_caption(
+                caption=Translation.AFTER_SUCCESSFUL_UPLOAD_MSG_WITH_TS,
+                parse_mode=enums.ParseMode.HTML
+            )
+            return True
+        # Too small, unknown length or not a file: fall back to the disk path
     start = datetime.now()
     await update.message.edit_caption(
         caption=Translation.DOWNLOAD_START,
@@ -72,28 +126,32 @@ async def ddl_call_back(bot, update):
     if not os.path.isdir(tmp_directory_for_each_user):
         os.makedirs(tmp_directory_for_each_user)
     download_directory = tmp_directory_for_each_user + "/" + custom_file_name
+    track_path(download_directory)
     command_to_exec = []
-    async with aiohttp.ClientSession() as session:
-        c_time = time.time()
-        try:
-            await download_coroutine(
-                bot,
-                session,
-                youtube_dl_url,
-                download_directory,
-                update.message.chat.id,
-                update.message.id,
-                c_time
-            )
-        except asyncio.TimeoutError:
-            await bot.edit_message_text(
-                text=Translation.SLOW_URL_DECED,
-                chat_id=update.message.chat.id,
-                message_id=update.message.id
-            )
-            return False
+    session = get_session()
+    c_time = time.time()
+    try:
+        await download_coroutine(
+            bot,
+            session,
+            youtube_dl_url,
+            download_directory,
+            update.message.chat.id,
+            update.message.id,
+            c_time
+        )
+    except (asyncio.TimeoutError, aiohttp.ClientError):
+        # Whatever landed is in the resume journal, sending the link again picks it up
+        await cancel_message_progress(update.message)
+        await bot.edit_message_text(
+            text=Translation.SLOW_URL_DECED,
+            chat_id=update.message.chat.id,
+            message_id=update.message.id
+        )
+        return False
     if os.path.exists(download_directory):
         end_one = datetime.now()
+        await cancel_message_progress(update.message)
         await update.message.edit_caption(
             caption=Translation.UPLOAD_START,
             parse_mode=enums.ParseMode.HTML
@@ -112,11 +170,18 @@ async def ddl_call_back(bot, update):
                 parse_mode=enums.ParseMode.HTML
             )
         else:
-            
+            content_key = None
+            if cacheable:
+                # Another link to the same bytes may have been uploaded already
+                content_key = media_cache.hash_key(await media_cache.file_digest(download_directory), send_type)
+                if await media_cache.send_cached(bot, update, content_key, description, [link_key]):
+                    os.remove(download_directory)
+                    await update.message.edit_caption(caption=Translation.CACHED_UPLOAD)
+                    return True
             start_time = time.time()
-            if (await db.get_upload_as_doc(update.from_user.id)) is False:
+            if upload_as_doc is False:
                 thumbnail = await Gthumb01(bot, update)
-                await update.message.reply_document(
+                sent = await update.message.reply_document(
                     document=download_directory,
                     thumb=thumbnail,
                     caption=description,
@@ -131,7 +196,7 @@ async def ddl_call_back(bot, update):
             else:
                  width, height, duration = await Mdata01(download_directory)
                  thumb_image_path = await Gthumb02(bot, update, duration, download_directory)
-                 await update.message.reply_video(
+                 sent = await update.message.reply_video(
                     video=download_directory,
                     caption=description,
                     duration=duration,
@@ -150,7 +215,7 @@ async def ddl_call_back(bot, update):
             if tg_send_type == "audio":
                 duration = await Mdata03(download_directory)
                 thumbnail = await Gthumb01(bot, update)
-                await update.message.reply_audio(
+                sent = await update.message.reply_audio(
                     audio=download_directory,
                     caption=description,
                     parse_mode=enums.ParseMode.HTML,
@@ -166,7 +231,7 @@ async def ddl_call_back(bot, update):
             elif tg_send_type == "vm":
                 width, duration = await Mdata02(download_directory)
                 thumbnail = await Gthumb02(bot, update, duration, download_directory)
-                await update.message.reply_video_note(
+                sent = await update.message.reply_video_note(
                     video_note=download_directory,
                     duration=duration,
                     length=width,
@@ -180,20 +245,24 @@ async def ddl_call_back(bot, update):
                 )
             else:
                 logger.info("Did this happen? :\\")
+            if cacheable:
+                await media_cache.remember([link_key, content_key], sent)
             end_two = datetime.now()
             try:
                 os.remove(download_directory)
-                os.remove(thumb_image_path)
+                release_thumb(thumb_image_path)
             except:
                 pass
             time_taken_for_download = (end_one - start).seconds
             time_taken_for_upload = (end_two - end_one).seconds
+            await cancel_message_progress(update.message)
             await update.message.edit_caption(
                 caption=Translation.AFTER_SUCCESSFUL_UPLOAD_MSG_WITH_TS.format(time_taken_for_download, time_taken_for_upload),
                
                 parse_mode=enums.ParseMode.HTML
             )
     else:
+        await cancel_message_progress(update.message)
         await update.message.edit_caption(
             caption=Translation.NO_VOID_FORMAT_FOUND.format("Incorrect Link"),
             parse_mode=enums.ParseMode.HTML
@@ -201,7 +270,33 @@ async def ddl_call_back(bot, update):
 
 async def download_coroutine(bot, session, url, file_name, chat_id, message_id, start):
     downloaded = 0
-    display_message = ""
+    last_report = 0
+
+    async def show_progress(downloaded, total_length):
+        now = time.time()
+        diff = now - start
+        percentage = downloaded * 100 / total_length
+        speed = downloaded / diff if diff else 0
+        elapsed_time = round(diff) * 1000
+        time_to_completion = round(
+            (total_length - downloaded) / speed) * 1000 if speed else 0
+        estimated_total_time = elapsed_time + time_to_completion
+        current_message = """**Download Status**
+URL: {}
+File Size: {}
+Downloaded: {}
+ETA: {}""".format(
+    url,
+    humanbytes(total_length),
+    humanbytes(downloaded),
+    TimeFormatter(estimated_total_time)
+)
+        set_stage("downloading")
+        if downloaded >= total_length:
+            await finish_progress(bot, chat_id, message_id, current_message)
+        else:
+            push_progress(bot, chat_id, message_id, current_message, reply_markup=cancel_markup())
+
     async with session.get(url, timeout=Config.PROCESS_MAX_TIMEOUT) as response:
         total_length = int(response.headers["Content-Length"])
         content_type = response.headers["Content-Type"]
@@ -214,41 +309,32 @@ async def download_coroutine(bot, session, url, file_name, chat_id, message_id,
 URL: {}
 File Size: {}""".format(url, humanbytes(total_length))
         )
-        with open(file_name, "wb") as f_handle:
-            while True:
-                chunk = await response.content.read(Config.CHUNK_SIZE)
-                if not chunk:
-                    break
-                f_handle.write(chunk)
-                downloaded += Config.CHUNK_SIZE
-                now = time.time()
-                diff = now - start
-                if round(diff % 5.00) == 0 or downloaded == total_length:
-                    percentage = downloaded * 100 / total_length
-                    speed = downloaded / diff
-                    elapsed_time = round(diff) * 1000
-                    time_to_completion = round(
-                        (total_length - downloaded) / speed) * 1000
-                    estimated_total_time = elapsed_time + time_to_completion
-                    try:
-                        current_message = """**Download Status**
-URL: {}
-File Size: {}
-Downloaded: {}
-ETA: {}""".format(
-    url,
-    humanbytes(total_length),
-    humanbytes(downloaded),
-    TimeFormatter(estimated_total_time)
-)
-                        if current_message != display_message:
-                            await bot.edit_message_text(
-                                chat_id,
-                                message_id,
-                                text=current_message
-                            )
-                            display_message = current_message
-                    except Exception as e:
-                        logger.info(str(e))
-                        pass
-        return await response.release()
+        if not supports_ranges(response):
+            # No Range support means nothing to resume from, stream it in one go
+            with open(file_name, "wb") as f_handle:
+                while True:
+                    chunk = await response.content.read(Config.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f_handle.write(chunk)
+                    downloaded += len(chunk)
+                    now = time.time()
+                    if now - last_report >= 1 or downloaded == total_length:
+                        last_report = now
+                        await show_progress(downloaded, total_length)
+            return await response.release()
+        validators = validators_of(response)
+        # The probe response only told us the server can do ranges,
+        # the segments below each open their own connection.
+        await response.release()
+    segments = Config.DOWNLOAD_SEGMENTS if total_length >= Config.SEGMENT_MIN_SIZE else 1
+    logger.info(f"Ranged download of {url} with {segments} connections")
+    await segmented_download(
+        session,
+        url,
+        file_name,
+        total_length,
+        segments,
+        progress=show_progress,
+        validators=validators
+    )
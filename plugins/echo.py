@@ -16,18 +16,18 @@ import time
 import random
 from pyrogram import enums
 from pyrogram import Client
-from plugins.functions.verify import verify_user, check_token, check_verification, get_token
-from plugins.functions.forcesub import handle_force_subscribe
+from plugins.functions.preflight import preflight
 from plugins.functions.display_progress import humanbytes
 from plugins.functions.help_uploadbot import DownLoadFile
 from plugins.functions.display_progress import progress_for_pyrogram, humanbytes, TimeFormatter
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import UserNotParticipant
 from plugins.functions.ran_text import random_char
 from plugins.database.database import db
 from plugins.database.add import AddUser
+from plugins.functions.ytdl_cache import get_cached_info, cache_info
+from plugins.functions import ytdl_pool
+from plugins.functions.ytdl_pool import YtdlError
 from pyrogram.types import Thumbnail
 cookies_file = 'cookies.txt'
 
@@ -37,41 +37,10 @@ cookies_file = 'cookies.txt'
 async def echo(bot, update):
     if "terabox.com" in update.text or "terabox.app" in update.text:
         return
-    if update.from_user.id != Config.OWNER_ID:  
-        if not await check_verification(bot, update.from_user.id) and Config.TRUE_OR_FALSE:
-            button = [[
-                InlineKeyboardButton("✓⃝ Vᴇʀɪꜰʏ ✓⃝", url=await get_token(bot, update.from_user.id, f"https://telegram.me/{Config.BOT_USERNAME}?start="))
-                ],[
-                InlineKeyboardButton("🔆 Wᴀᴛᴄʜ Hᴏᴡ Tᴏ Vᴇʀɪꜰʏ 🔆", url=f"{Config.VERIFICATION}")
-            ]]
-            await update.reply_text(
-                text="<b>Pʟᴇᴀsᴇ Vᴇʀɪꜰʏ Fɪʀsᴛ Tᴏ Usᴇ Mᴇ</b>",
-                protect_content=True,
-                reply_markup=InlineKeyboardMarkup(button)
-            )
-            return
-    if Config.LOG_CHANNEL:
-        try:
-            log_message = await update.forward(Config.LOG_CHANNEL)
-            log_info = "Message Sender Information\n"
-            log_info += "\nFirst Name: " + update.from_user.first_name
-            log_info += "\nUser ID: " + str(update.from_user.id)
-            log_info += "\nUsername: @" + (update.from_user.username if update.from_user.username else "")
-            log_info += "\nUser Link: " + update.from_user.mention
-            await log_message.reply_text(
-                text=log_info,
-                disable_web_page_preview=True,
-                quote=True
-            )
-        except Exception as error:
-            print(error)
     if not update.from_user:
         return await update.reply_text("I don't know about you sar :(")
-    await AddUser(bot, update)
-    if Config.UPDATES_CHANNEL:
-        fsub = await handle_force_subscribe(bot, update)
-        if fsub == 400:
-            return
+    if not await preflight(bot, update):
+        return
 
 
     logger.info(update.from_user)
@@ -139,43 +108,52 @@ async def echo(bot, update):
         command_to_exec.append("--password")
         command_to_exec.append(youtube_dl_password)
     logger.info(command_to_exec)
-    chk = await bot.send_message(
-            chat_id=update.chat.id,
-            text=f'ᴘʀᴏᴄᴇssɪɴɢ ʏᴏᴜʀ ʟɪɴᴋ ⌛',
-            disable_web_page_preview=True,
-            reply_to_message_id=update.id,
-            parse_mode=enums.ParseMode.HTML
-          )
-    process = await asyncio.create_subprocess_exec(
-        *command_to_exec,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    # Wait for the subprocess to finish
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    logger.info(e_response)
-    t_response = stdout.decode().strip()
-    if e_response and "nonnumeric port" not in e_response:
-        # logger.warn("Status : FAIL", exc.returncode, exc.output)
-        error_message = e_response.replace("please report this issue on https://yt-dl.org/bug . Make sure you are using the latest version; see  https://yt-dl.org/update  on how to update. Be sure to call youtube-dl with the --verbose flag and include its complete output.", "")
-        if "This video is only available for registered users." in error_message:
-            error_message += Translation.SET_CUSTOM_USERNAME_PASSWORD
-        await chk.delete()
+    response_json = None
+    credentials = youtube_dl_username is not None or youtube_dl_password is not None
+    if not credentials:
+        response_json = await get_cached_info(url)
+    if response_json is not None:
+        # Same link was probed recently, no need to run yt-dlp again
+        logger.info(f"yt-dlp cache hit for {url}")
+        chk = None
+    else:
+        chk = await bot.send_message(
+                chat_id=update.chat.id,
+                text=f'ᴘʀᴏᴄᴇssɪɴɢ ʏᴏᴜʀ ʟɪɴᴋ ⌛',
+                disable_web_page_preview=True,
+                reply_to_message_id=update.id,
+                parse_mode=enums.ParseMode.HTML
+              )
+        try:
+            # Probes have their own workers and bounded queue in ytdl_pool, they must not
+            # wait behind downloads for a scheduler slot inside the message handler
+            response_json = await ytdl_pool.probe(command_to_exec[1:])
+            e_response = ""
+        except YtdlError as e:
+            e_response = str(e).strip()
+        logger.info(e_response)
+        if e_response and "nonnumeric port" not in e_response:
+            # logger.warn("Status : FAIL", exc.returncode, exc.output)
+            error_message = e_response.replace("please report this issue on https://yt-dl.org/bug . Make sure you are using the latest version; see  https://yt-dl.org/update  on how to update. Be sure to call youtube-dl with the --verbose flag and include its complete output.", "")
+            if "This video is only available for registered users." in error_message:
+                error_message += Translation.SET_CUSTOM_USERNAME_PASSWORD
+            await chk.delete()
         
-        time.sleep(10)
-        await bot.send_message(
-            chat_id=update.chat.id,
-            text=Translation.NO_VOID_FORMAT_FOUND.format(str(error_message)),
-            reply_to_message_id=update.id,
-            disable_web_page_preview=True
-        )
-        return False
-    if t_response:
-        x_reponse = t_response
-        if "\n" in x_reponse:
-            x_reponse, _ = x_reponse.split("\n")
-        response_json = json.loads(x_reponse)
+            await asyncio.sleep(10)
+            await bot.send_message(
+                chat_id=update.chat.id,
+                text=Translation.NO_VOID_FORMAT_FOUND.format(str(error_message)),
+                reply_to_message_id=update.id,
+                disable_web_page_preview=True
+            )
+            return False
+        if response_json is not None:
+            if response_json.get("_type") == "playlist" and response_json.get("entries"):
+                # `yt-dlp -j` used to hand back the first entry's line
+                response_json = response_json["entries"][0]
+            if not credentials:
+                await cache_info(url, response_json)
+    if response_json is not None:
         randem = random_char(5)
         save_ytdl_json_path = Config.DOWNLOAD_LOCATION + \
             "/" + str(update.from_user.id) + f'{randem}' + ".json"
@@ -266,7 +244,8 @@ async def echo(bot, update):
                 )
             ])
         reply_markup = InlineKeyboardMarkup(inline_keyboard)
-        await chk.delete()
+        if chk is not None:
+            await chk.delete()
         await bot.send_message(
             chat_id=update.chat.id,
             text=Translation.FORMAT_SELECTION.format(Thumbnail) + "\n" + Translation.SET_CUSTOM_USERNAME_PASSWORD,
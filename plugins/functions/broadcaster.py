@@ -0,0 +1,193 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import datetime
+import time
+import traceback
+import aiofiles
+import aiofiles.os
+from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
+from plugins.config import Config
+from plugins.database.database import db
+from plugins.functions.display_progress import TimeFormatter
+from plugins.functions.progress_editor import TokenBucket, push_progress
+from plugins.functions.jobs import start_job, cancel_markup
+
+# broadcast id -> live counters, dropping an entry stops that broadcast
+broadcast_ids = {}
+
+
+class AdaptiveBucket(TokenBucket):
+    """Send budget that halves on FloodWait and creeps back up while sends succeed"""
+
+    def __init__(self, rate, capacity):
+        super().__init__(rate, capacity)
+        self.max_rate = rate
+        self.streak = 0
+
+    def backoff(self, seconds):
+        """Pause for seconds, halving the rate unless this flood was already being waited out"""
+        in_flood = time.monotonic() < self.paused_until
+        self.pause(seconds)
+        self.streak = 0
+        if in_flood:
+            return False
+        self.rate = max(1, self.rate / 2)
+        return True
+
+    def reward(self):
+        self.streak += 1
+        if self.streak >= Config.BROADCAST_BATCH and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + 1)
+            self.streak = 0
+
+
+limiter = AdaptiveBucket(Config.BROADCAST_RATE, Config.BROADCAST_RATE)
+
+
+async def send_msg(bot, user_id, state):
+    for _ in range(3):
+        await limiter.acquire()
+        try:
+            await bot.copy_message(
+                chat_id=user_id,
+                from_chat_id=state['from_chat_id'],
+                message_id=state['message_id']
+            )
+            limiter.reward()
+            return 200, None
+        except FloodWait as e:
+            if limiter.backoff(e.value):
+                logger.info(f"Broadcast FloodWait {e.value}s, slowing down to {limiter.rate}/s")
+        except InputUserDeactivated:
+            return 400, f"{user_id} : deactivated\n"
+        except UserIsBlocked:
+            return 400, f"{user_id} : blocked the bot\n"
+        except PeerIdInvalid:
+            return 400, f"{user_id} : user id invalid\n"
+        except Exception:
+            return 500, f"{user_id} : {traceback.format_exc()}\n"
+    return 500, f"{user_id} : still flood limited after retries\n"
+
+
+def new_broadcast(broadcast_id, message, status_message, total_users):
+    return dict(
+        _id=broadcast_id,
+        from_chat_id=message.chat.id,
+        message_id=message.id,
+        status_chat_id=status_message.chat.id,
+        status_message_id=status_message.id,
+        total=total_users,
+        done=0,
+        success=0,
+        failed=0,
+        last_id=None,
+        started=time.time(),
+        status='running'
+    )
+
+
+def status_text(state):
+    elapsed = time.time() - state['started']
+    remaining = max(state['total'] - state['done'], 0)
+    eta = remaining * elapsed / state['done'] * 1000 if state['done'] else 0
+    return (
+        f"Broadcast `{state['_id']}` in progress\n\n"
+        f"Done {state['done']} of {state['total']}\n"
+        f"Success {state['success']}, failed {state['failed']}\n"
+        f"Sending at {limiter.rate:.0f} msg/s\n"
+        f"ETA: {TimeFormatter(eta) or '0s'}"
+    )
+
+
+async def run_broadcast(bot, state):
+    """Send to every user after state['last_id'], checkpointing after each batch"""
+    broadcast_id = state['_id']
+    broadcast_ids[broadcast_id] = state
+    log_file = f"broadcast_{broadcast_id}.txt"
+    semaphore = asyncio.Semaphore(Config.BROADCAST_CONCURRENCY)
+
+    async def deliver(user):
+        async with semaphore:
+            return user, await send_msg(bot, int(user['id']), state)
+
+    async with aiofiles.open(log_file, 'a') as broadcast_log_file:
+
+        async def send_batch(batch):
+            dead = []
+            for user, (sts, msg) in await asyncio.gather(*[deliver(u) for u in batch]):
+                if msg is not None:
+                    await broadcast_log_file.write(msg)
+                if sts == 200:
+                    state['success'] += 1
+                else:
+                    state['failed'] += 1
+                if sts == 400:
+                    dead.append(user['id'])
+                state['done'] += 1
+            if dead:
+                await db.delete_users(dead)
+            # Checkpoint: a restart carries on after the last user of this batch
+            state['last_id'] = batch[-1]['_id']
+            await db.save_broadcast(state)
+            push_progress(
+                bot,
+                state['status_chat_id'],
+                state['status_message_id'],
+                status_text(state),
+                reply_markup=cancel_markup()
+            )
+
+        batch = []
+        async for user in db.get_users_after(state['last_id']):
+            batch.append(user)
+            if len(batch) >= Config.BROADCAST_BATCH:
+                await send_batch(batch)
+                batch = []
+                if broadcast_ids.get(broadcast_id) is None:
+                    break
+        if batch and broadcast_ids.get(broadcast_id) is not None:
+            await send_batch(batch)
+
+    cancelled = broadcast_ids.pop(broadcast_id, None) is None
+    state['status'] = 'cancelled' if cancelled else 'done'
+    await db.save_broadcast(state)
+    await finish_broadcast(bot, state, log_file)
+
+
+async def finish_broadcast(bot, state, log_file):
+    completed_in = datetime.timedelta(seconds=int(time.time() - state['started']))
+    summary = (
+        f"broadcast {state['status']} in `{completed_in}`\n\n"
+        f"Total users {state['total']}.\n"
+        f"Total done {state['done']}, {state['success']} success and {state['failed']} failed."
+    )
+    try:
+        await bot.delete_messages(state['status_chat_id'], state['status_message_id'])
+    except Exception:
+        pass
+    if state['failed'] == 0:
+        await bot.send_message(state['status_chat_id'], summary)
+    else:
+        await bot.send_document(state['status_chat_id'], log_file, caption=summary)
+    await aiofiles.os.remove(log_file)
+
+
+def start_broadcast(bot, state):
+    """Run a broadcast as a job, cancelling it stops after the batch in flight"""
+    broadcast_id = state['_id']
+    return start_job(
+        run_broadcast(bot, state),
+        "broadcast",
+        Config.OWNER_ID,
+        f"Broadcast {broadcast_id}",
+        on_cancel=lambda: broadcast_ids.pop(broadcast_id, None)
+    )
+
+
+async def resume_broadcasts(bot):
+    """Pick up broadcasts that were still running when the bot went down"""
+    for state in await db.get_running_broadcasts():
+        logger.info(f"Resuming broadcast {state['_id']} after {state['done']} users")
+        start_broadcast(bot, state)
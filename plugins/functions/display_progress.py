@@ -4,6 +4,8 @@ import time
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from plugins.script import Translation
 from pyrogram import enums 
+from plugins.functions.progress_editor import push_message_progress, finish_message_progress
+from plugins.functions.jobs import cancel_markup, set_stage
 
 
 
@@ -11,45 +13,38 @@ from pyrogram import enums
 async def progress_for_pyrogram(current, total, ud_type, message, start):
     now = time.time()
     diff = now - start
-    if round(diff % 10.00) == 0 or current == total:
-        percentage = current * 100 / total
-        speed = current / diff
-        elapsed_time = round(diff) * 1000
-        time_to_completion = round((total - current) / speed) * 1000
-        estimated_total_time = elapsed_time + time_to_completion
+    percentage = current * 100 / total if total else 0
+    speed = current / diff if diff else 0
+    elapsed_time = round(diff) * 1000
+    time_to_completion = round((total - current) / speed) * 1000 if speed else 0
+    estimated_total_time = elapsed_time + time_to_completion
 
-        elapsed_time = TimeFormatter(milliseconds=elapsed_time)
-        estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
+    elapsed_time = TimeFormatter(milliseconds=elapsed_time)
+    estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
 
-        progress = "┏━━━━✦[{0}{1}]✦━━━━".format(
-            ''.join(["▣" for i in range(math.floor(percentage / 10))]),
-            ''.join(["▢" for i in range(10 - math.floor(percentage / 10))])
-        )
+    progress = "┏━━━━✦[{0}{1}]✦━━━━".format(
+        ''.join(["▣" for i in range(math.floor(percentage / 10))]),
+        ''.join(["▢" for i in range(10 - math.floor(percentage / 10))])
+    )
 
-        tmp = progress + Translation.PROGRESS.format(
-            round(percentage, 2),
-            humanbytes(current),
-            humanbytes(total),
-            humanbytes(speed),
-            estimated_total_time if estimated_total_time != '' else "0 s"
-        )
-        try:
-            await message.edit(
-              text= Translation.PROGRES.format(
-              ud_type,
-              tmp
-                ),
-                parse_mode=enums.ParseMode.MARKDOWN,
-                reply_markup=InlineKeyboardMarkup(
-                    [
-                        [ 
-                        InlineKeyboardButton('⛔ Cancel', callback_data=f"cancel_download+{id}")
-                       ]
-                   ]
-                 )
-            )
-        except:
-            pass
+    tmp = progress + Translation.PROGRESS.format(
+        round(percentage, 2),
+        humanbytes(current),
+        humanbytes(total),
+        humanbytes(speed),
+        estimated_total_time if estimated_total_time != '' else "0 s"
+    )
+    # Pyrogram calls this for every uploaded part, the editor decides what actually gets sent
+    kwargs = dict(
+        parse_mode=enums.ParseMode.MARKDOWN,
+        reply_markup=cancel_markup()
+    )
+    text = Translation.PROGRES.format(ud_type, tmp)
+    set_stage("uploading")
+    if current == total:
+        await finish_message_progress(message, text, **kwargs)
+    else:
+        push_message_progress(message, text, **kwargs)
 
 
 def humanbytes(size):
@@ -0,0 +1,249 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import aiohttp
+from plugins.config import Config
+
+# Pieces smaller than this are not worth their own connection
+MIN_PIECE_SIZE = 1024 * 1024
+# Read size per segment, small reads spend the time in Python per-chunk overhead
+SEGMENT_CHUNK = 1024 * 1024
+# Bytes a running segment may still hold in its write buffer, never journaled as done
+UNFLUSHED_MARGIN = 64 * 1024
+
+
+def split_ranges(total_length, segments):
+    """Split [0, total_length) into inclusive byte ranges, one per segment"""
+    return split_pending([[0, total_length - 1]], segments)
+
+
+def split_pending(ranges, segments):
+    """Halve the largest inclusive ranges until there are `segments` of them"""
+    ranges = sorted([list(r) for r in ranges if r[0] <= r[1]])
+    while 0 < len(ranges) < segments:
+        largest = max(ranges, key=lambda r: r[1] - r[0])
+        size = largest[1] - largest[0] + 1
+        if size < 2 * MIN_PIECE_SIZE:
+            break
+        middle = largest[0] + size // 2
+        ranges.remove(largest)
+        ranges.extend([[largest[0], middle - 1], [middle, largest[1]]])
+        ranges.sort()
+    return ranges
+
+
+def supports_ranges(response):
+    """True when the server advertises byte ranges and a known length"""
+    return (
+        response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        and int(response.headers.get("Content-Length", 0)) > 0
+    )
+
+
+def validators_of(response):
+    """The headers that tell us whether a partial file still matches the remote one"""
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def preallocate(file_name, total_length):
+    # Segments write at their own offsets, so the file has to exist at full size first
+    mode = "r+b" if os.path.exists(file_name) else "wb"
+    with open(file_name, mode) as f_handle:
+        f_handle.truncate(total_length)
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class ResumeJournal:
+    """On-disk record of which byte ranges of a download have already landed.
+
+    One JSON file per target path lives in Config.RESUME_JOURNAL_DIR, so a
+    restarted bot (or a retry after a dropped connection) can carry on with
+    Range requests instead of starting from byte zero.
+    """
+
+    def __init__(self, url, file_name, total_length, validators=None):
+        self.url = url
+        self.file_name = file_name
+        self.total_length = total_length
+        self.validators = validators or {}
+        self.done = []
+        key = hashlib.sha1(os.path.abspath(file_name).encode("utf8")).hexdigest()
+        self.path = os.path.join(Config.RESUME_JOURNAL_DIR, key + ".json")
+
+    def load(self):
+        """Pick up a previous journal if it still describes the same remote file"""
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if not self.matches(state):
+            logger.info(f"Discarding stale resume journal for {self.file_name}")
+            self.discard()
+            return False
+        self.done = merge_ranges(state.get("done", []))
+        return True
+
+    def matches(self, state):
+        if state.get("total_length") != self.total_length:
+            return False
+        if not os.path.exists(self.file_name) or os.path.getsize(self.file_name) != self.total_length:
+            return False
+        old = state.get("validators", {})
+        compared = False
+        for key in ("etag", "last_modified"):
+            if old.get(key) and self.validators.get(key):
+                if old[key] != self.validators[key]:
+                    return False
+                compared = True
+        # Without validators only the very same URL is trusted
+        return compared or state.get("url") == self.url
+
+    def pending(self):
+        """Inclusive byte ranges that still have to be fetched"""
+        missing = []
+        position = 0
+        for start, end in self.done:
+            if start > position:
+                missing.append([position, start - 1])
+            position = max(position, end + 1)
+        if position < self.total_length:
+            missing.append([position, self.total_length - 1])
+        return missing
+
+    def completed(self):
+        return sum(end - start + 1 for start, end in self.done)
+
+    def save(self, live=()):
+        """Persist finished ranges plus the progress of the running segments"""
+        done = list(self.done)
+        for origin, byte_range in live:
+            end = byte_range[0] - 1
+            if byte_range[0] <= byte_range[1]:
+                end -= UNFLUSHED_MARGIN
+            if end >= origin:
+                done.append([origin, end])
+        state = dict(
+            url=self.url,
+            file_name=self.file_name,
+            total_length=self.total_length,
+            validators=self.validators,
+            done=merge_ranges(done),
+            updated=time.time(),
+        )
+        os.makedirs(Config.RESUME_JOURNAL_DIR, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def fetch_segment(session, url, file_name, byte_range, counter, headers=None,
+                        retries=None, ssl=True):
+    """Download one inclusive byte range into file_name at its offset.
+
+    byte_range is a mutable [start, end] pair, start moves forward as bytes land
+    so a retry only asks for what is still missing.
+    """
+    retries = Config.DOWNLOAD_RETRIES if retries is None else retries
+    attempt = 0
+    while byte_range[0] <= byte_range[1]:
+        request_headers = dict(headers or {})
+        request_headers["Range"] = "bytes={}-{}".format(byte_range[0], byte_range[1])
+        try:
+            async with session.get(
+                url,
+                headers=request_headers,
+                timeout=aiohttp.ClientTimeout(total=Config.PROCESS_MAX_TIMEOUT, sock_read=60),
+                ssl=ssl,
+            ) as response:
+                if response.status != 206:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message="range request not honoured",
+                    )
+                with open(file_name, "r+b") as f_handle:
+                    f_handle.seek(byte_range[0])
+                    async for chunk in response.content.iter_chunked(SEGMENT_CHUNK):
+                        chunk = chunk[:byte_range[1] - byte_range[0] + 1]
+                        f_handle.write(chunk)
+                        byte_range[0] += len(chunk)
+                        counter[0] += len(chunk)
+                        if byte_range[0] > byte_range[1]:
+                            break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logger.info(f"Segment {byte_range} failed ({e}), retry {attempt}/{retries}")
+            await asyncio.sleep(attempt)
+
+
+async def segmented_download(session, url, file_name, total_length, segments=None,
+                             progress=None, interval=5, headers=None, validators=None,
+                             ssl=True):
+    """Download url with concurrent Range requests into file_name.
+
+    Ranges already recorded in the resume journal are skipped. progress, when
+    given, is awaited as progress(downloaded, total_length) every interval
+    seconds and once more when everything has landed.
+    """
+    segments = segments or Config.DOWNLOAD_SEGMENTS
+    journal = ResumeJournal(url, file_name, total_length, validators)
+    if journal.load():
+        logger.info(f"Resuming {file_name} from {journal.completed()} of {total_length} bytes")
+    else:
+        preallocate(file_name, total_length)
+    counter = [journal.completed()]
+    live = [(r[0], r) for r in split_pending(journal.pending(), segments)]
+    tasks = [
+        asyncio.ensure_future(
+            fetch_segment(session, url, file_name, byte_range, counter, headers, ssl=ssl)
+        )
+        for _, byte_range in live
+    ]
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=interval, return_when=asyncio.FIRST_EXCEPTION
+            )
+            if any(task.exception() for task in done):
+                break
+            journal.save(live)
+            if progress is not None:
+                await progress(counter[0], total_length)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        journal.save(live)
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+    journal.discard()
+    return counter[0]
@@ -0,0 +1,103 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import os
+import time
+from plugins.config import Config
+
+
+class FfmpegPool:
+    """Runs ffmpeg processes at most `workers` at a time, at a lower CPU priority.
+
+    Jobs that outlive their timeout or whose task is cancelled have their
+    process killed, so a stuck encode can't hold a slot forever, and the
+    half written outputs of a timed out job are removed.
+    """
+
+    def __init__(self, workers, nice):
+        self.workers = workers
+        self.nice = nice
+        self.semaphore = asyncio.Semaphore(workers)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def _niced(self, command):
+        # nice(1) in front instead of a preexec_fn, which isn't safe with threads around
+        if self.nice:
+            return ["nice", "-n", str(self.nice)] + list(command)
+        return command
+
+    async def run(self, command, timeout=None, outputs=()):
+        """Run command and return (returncode, stdout, stderr), returncode is None on timeout.
+
+        The files in outputs are deleted when the command times out.
+        """
+        queued = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.monotonic()
+        self.wait_time += started - queued
+        self.running += 1
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._niced(command),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(), timeout or Config.PROCESS_MAX_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                logger.info(f"{command[0]} timed out, killed pid {process.pid}")
+                process.kill()
+                await process.wait()
+                for output in outputs:
+                    try:
+                        os.remove(output)
+                    except OSError:
+                        pass
+                return None, "", "timed out"
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+            if process.returncode == 0:
+                self.completed += 1
+            else:
+                self.failed += 1
+            return process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        finally:
+            self.running -= 1
+            self.run_time += time.monotonic() - started
+            self.semaphore.release()
+
+    def stats(self):
+        done = self.completed + self.failed + self.timed_out
+        return dict(
+            workers=self.workers,
+            running=self.running,
+            waiting=self.waiting,
+            completed=self.completed,
+            failed=self.failed,
+            timed_out=self.timed_out,
+            avg_wait=self.wait_time / done if done else 0,
+            avg_run=self.run_time / done if done else 0
+        )
+
+
+pool = FfmpegPool(Config.FFMPEG_WORKERS, Config.FFMPEG_NICE)
+
+
+async def run_ffmpeg(command, timeout=None, outputs=()):
+    return await pool.run(command, timeout, outputs)
@@ -1,10 +1,98 @@
-import os
+import logging
+logger = logging.getLogger(__name__)
+
 import asyncio
+import time
+from collections import OrderedDict
 from plugins.config import Config
 from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus
 from pyrogram.errors import FloodWait, UserNotParticipant, ChatAdminRequired, PeerIdInvalid, ChannelInvalid
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+MEMBER = "member"
+BANNED = "banned"
+MISSING = "missing"
+
+# user id -> (unix time the answer is good until, MEMBER/BANNED/MISSING)
+_members = OrderedDict()
+
+# One invite link for everyone, instead of a new one per message
+_invite_link = None
+_invite_lock = asyncio.Lock()
+
+
+def channel_id():
+    channel = str(Config.UPDATES_CHANNEL)
+    return int(channel) if channel.lstrip("-").isdigit() else channel
+
+
+def _status_of(member):
+    if member.status == ChatMemberStatus.BANNED:
+        return BANNED
+    if member.status == ChatMemberStatus.LEFT:
+        return MISSING
+    if member.status == ChatMemberStatus.RESTRICTED and not member.is_member:
+        return MISSING
+    return MEMBER
+
+
+def remember_member(user_id, status):
+    ttl = Config.FSUB_MEMBER_TTL if status == MEMBER else Config.FSUB_NEGATIVE_TTL
+    _members[user_id] = (time.time() + ttl, status)
+    _members.move_to_end(user_id)
+    while len(_members) > Config.FSUB_CACHE_SIZE:
+        _members.popitem(last=False)
+
+
+async def membership(bot, user_id, fresh=False):
+    """MEMBER, BANNED or MISSING for user_id in the updates channel, cached unless fresh.
+
+    Other errors are raised and not cached.
+    """
+    if not fresh:
+        entry = _members.get(user_id)
+        if entry is not None and entry[0] > time.time():
+            _members.move_to_end(user_id)
+            return entry[1]
+    try:
+        status = _status_of(await bot.get_chat_member(channel_id(), user_id))
+    except UserNotParticipant:
+        status = MISSING
+    remember_member(user_id, status)
+    return status
+
+
+async def get_invite_link(bot):
+    """The channel's link, asked for once per run; the primary link is used when the bot can see it"""
+    global _invite_link
+    async with _invite_lock:
+        if _invite_link is None:
+            chat = await bot.get_chat(channel_id())
+            _invite_link = chat.invite_link
+            if _invite_link is None:
+                _invite_link = (await bot.create_chat_invite_link(channel_id())).invite_link
+    return _invite_link
+
+
+def join_markup(invite_link):
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton("Join Channel", url=invite_link)],
+            [InlineKeyboardButton("Refresh", callback_data="refreshForceSub")]
+        ]
+    )
+
+
+async def on_member_updated(bot, update):
+    """Keep the cache in step with joins, leaves and bans the bot gets to see"""
+    member = update.new_chat_member
+    user = (member.user if member else None) or (update.old_chat_member.user if update.old_chat_member else None)
+    if user is None:
+        return
+    remember_member(user.id, _status_of(member) if member else MISSING)
+
+
 async def handle_force_subscribe(bot, message):
     if not Config.UPDATES_CHANNEL:
         await bot.send_message(
@@ -15,43 +103,40 @@ async def handle_force_subscribe(bot, message):
         return 400
 
     try:
-        invite_link = await bot.create_chat_invite_link(int(Config.UPDATES_CHANNEL))
-    except FloodWait as e:
-        await asyncio.sleep(e.x)
-        return 400
-    except (ChatAdminRequired, PeerIdInvalid, ChannelInvalid, KeyError, ValueError) as e:
-        await bot.send_message(
-            chat_id=message.from_user.id,
-            text="Bot is not properly configured or missing access to the Updates Channel.\nPlease contact the admin!",
-            disable_web_page_preview=True,
-        )
-        return 400
-
-    try:
-        user = await bot.get_chat_member(int(Config.UPDATES_CHANNEL), message.from_user.id)
-        if user.status == "kicked":
+        status = await membership(bot, message.from_user.id)
+        if status == MEMBER:
+            return
+        if status == BANNED:
             await bot.send_message(
                 chat_id=message.from_user.id,
                 text="Sorry, you are banned from using this bot.",
                 disable_web_page_preview=True,
             )
             return 400
-    except UserNotParticipant:
+        invite_link = await get_invite_link(bot)
+    except FloodWait as e:
+        await asyncio.sleep(e.value)
+        return 400
+    except (ChatAdminRequired, PeerIdInvalid, ChannelInvalid, KeyError, ValueError) as e:
+        logger.error(f"Force subscribe check failed: {e}")
         await bot.send_message(
             chat_id=message.from_user.id,
-            text="Please join the Updates Channel to use this bot!",
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [InlineKeyboardButton("Join Channel", url=invite_link.invite_link)],
-                    [InlineKeyboardButton("Refresh", callback_data="refreshForceSub")]
-                ]
-            ),
+            text="Bot is not properly configured or missing access to the Updates Channel.\nPlease contact the admin!",
+            disable_web_page_preview=True,
         )
         return 400
-    except Exception:
+    except Exception as e:
+        logger.error(f"Force subscribe check failed: {e}")
         await bot.send_message(
             chat_id=message.from_user.id,
             text="An unexpected error occurred.\nPlease contact support.",
             disable_web_page_preview=True,
         )
         return 400
+
+    await bot.send_message(
+        chat_id=message.from_user.id,
+        text="Please join the Updates Channel to use this bot!",
+        reply_markup=join_markup(invite_link),
+    )
+    return 400
@@ -8,56 +8,32 @@ logger = logging.getLogger(__name__)
 import asyncio
 import os
 import time
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
+from plugins.functions.media_probe import probe
+from plugins.functions.ffmpeg_pool import run_ffmpeg
 
 
 async def place_water_mark(input_file, output_file, water_mark_file):
-    watermarked_file = output_file + "@UploaderXNTBot"
-    metadata = extractMetadata(createParser(input_file))
-    width = metadata.get("width")
+    width = (await probe(input_file))["width"]
     # https://stackoverflow.com/a/34547184/4723940
-    shrink_watermark_file_genertor_command = [
-        "ffmpeg",
-        "-i", water_mark_file,
-        "-y -v quiet",
-        "-vf",
-        "scale={}*0.5:-1".format(width),
-        watermarked_file
-    ]
-    # print(shrink_watermark_file_genertor_command)
-    process = await asyncio.create_subprocess_exec(
-        *shrink_watermark_file_genertor_command,
-        # stdout must a pipe to be accessible as process.stdout
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    # Wait for the subprocess to finish
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
+    # Shrink and overlay in one filter graph, one ffmpeg run instead of two
     commands_to_execute = [
         "ffmpeg",
+        "-y", "-v", "quiet",
         "-i", input_file,
-        "-i", watermarked_file,
+        "-i", water_mark_file,
         "-filter_complex",
-        "\"overlay=(main_w-overlay_w):(main_h-overlay_h)\"",
+        "[1:v]{}[wm];[0:v][wm]overlay=(main_w-overlay_w):(main_h-overlay_h)".format(_watermark_scale(width)),
         output_file
     ]
-    # print(commands_to_execute)
-    process = await asyncio.create_subprocess_exec(
-        *commands_to_execute,
-        # stdout must a pipe to be accessible as process.stdout
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    # Wait for the subprocess to finish
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
+    await run_ffmpeg(commands_to_execute, outputs=[output_file])
     return output_file
 
 
+def _watermark_scale(width):
+    # Watermark at half the width of the picture it goes on
+    return "scale={}:-1".format(width // 2) if width >= 2 else "null"
+
+
 async def take_screen_shot(video_file, output_directory, ttl):
     # https://stackoverflow.com/a/13891070/4723940
     out_put_file_name = output_directory + \
@@ -73,16 +49,7 @@ async def take_screen_shot(video_file, output_directory, ttl):
         out_put_file_name
     ]
     # width = "90"
-    process = await asyncio.create_subprocess_exec(
-        *file_genertor_command,
-        # stdout must a pipe to be accessible as process.stdout
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    # Wait for the subprocess to finish
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
+    await run_ffmpeg(file_genertor_command, outputs=[out_put_file_name])
     if os.path.lexists(out_put_file_name):
         return out_put_file_name
     else:
@@ -106,21 +73,42 @@ async def cult_small_video(video_file, output_directory, start_time, end_time):
         "-2",
         out_put_file_name
     ]
-    process = await asyncio.create_subprocess_exec(
-        *file_genertor_command,
-        # stdout must a pipe to be accessible as process.stdout
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    # Wait for the subprocess to finish
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
+    await run_ffmpeg(file_genertor_command, outputs=[out_put_file_name])
     if os.path.lexists(out_put_file_name):
         return out_put_file_name
     else:
         return None
 
+# ffmpeg encoder for each audio format the audio buttons offer
+AUDIO_CODECS = {
+    "mp3": "libmp3lame",
+    "m4a": "aac",
+    "opus": "libopus",
+    "ogg": "libvorbis",
+    "flac": "flac",
+    "wav": "pcm_s16le",
+}
+
+
+async def extract_audio(input_file, output_file, audio_format, quality):
+    """What yt-dlp's --extract-audio did, run through the ffmpeg pool"""
+    command = [
+        "ffmpeg",
+        "-y", "-v", "quiet",
+        "-i", input_file,
+        "-vn",
+        "-map_metadata", "0",
+        "-c:a", AUDIO_CODECS.get(audio_format, "libmp3lame"),
+    ]
+    if audio_format not in ("flac", "wav"):
+        command += ["-b:a", quality]
+    command.append(output_file)
+    await run_ffmpeg(command, outputs=[output_file])
+    if os.path.lexists(output_file):
+        return output_file
+    else:
+        return None
+
 # ©️ LISA-KOREA | @LISA_FAN_LK | NT_BOT_CHANNEL
 async def generate_screen_shots(
     video_file,
@@ -130,23 +118,41 @@ async def generate_screen_shots(
     min_duration,
     no_of_photos
 ):
-    metadata = extractMetadata(createParser(video_file))
-    duration = 0
-    if metadata is not None:
-        if metadata.has("duration"):
-            duration = metadata.get('duration').seconds
-    if duration > min_duration:
-        images = []
-        ttl_step = duration // no_of_photos
-        current_ttl = ttl_step
-        for looper in range(0, no_of_photos):
-            ss_img = await take_screen_shot(video_file, output_directory, current_ttl)
-            current_ttl = current_ttl + ttl_step
-            if is_watermarkable:
-                ss_img = await place_water_mark(ss_img, output_directory + "/" + str(time.time()) + ".jpg", wf)
-            images.append(ss_img)
-        return images
-    else:
-        return None
-
+    """Grab no_of_photos evenly spaced frames, watermarked if asked, with a single ffmpeg run.
 
+    Every frame is its own input with a fast seek in front of it, so ffmpeg
+    jumps straight to each timestamp instead of decoding the whole video.
+    """
+    info = await probe(video_file)
+    duration = info["duration"]
+    if duration <= min_duration:
+        return None
+    ttl_step = duration // no_of_photos
+    ttls = [min(ttl_step * (looper + 1), duration - 1) for looper in range(no_of_photos)]
+    stamp = time.time()
+    images = [
+        os.path.join(output_directory, "{}_{}.jpg".format(stamp, looper))
+        for looper in range(no_of_photos)
+    ]
+    command = ["ffmpeg", "-y", "-v", "quiet"]
+    for ttl in ttls:
+        command += ["-ss", str(ttl), "-i", video_file]
+    outputs = ["{}:v:0".format(looper) for looper in range(no_of_photos)]
+    if is_watermarkable and wf:
+        command += ["-i", wf]
+        graph = ["[{}:v]{},split={}{}".format(
+            no_of_photos,
+            _watermark_scale(info["width"]),
+            no_of_photos,
+            "".join("[wm{}]".format(looper) for looper in range(no_of_photos))
+        )]
+        for looper in range(no_of_photos):
+            graph.append(
+                "[{0}:v][wm{0}]overlay=(main_w-overlay_w):(main_h-overlay_h)[ss{0}]".format(looper)
+            )
+        command += ["-filter_complex", ";".join(graph)]
+        outputs = ["[ss{}]".format(looper) for looper in range(no_of_photos)]
+    for output, image in zip(outputs, images):
+        command += ["-map", output, "-frames:v", "1", image]
+    await run_ffmpeg(command, outputs=images)
+    return [image for image in images if os.path.lexists(image)] or None
@@ -0,0 +1,38 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import aiohttp
+from plugins.config import Config
+
+# One pooled session for the whole bot, so keep-alive connections and the
+# DNS cache are shared instead of rebuilt for every request.
+_session = None
+
+
+def get_session():
+    """Return the shared aiohttp session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=Config.HTTP_POOL_SIZE,
+            limit_per_host=Config.HTTP_PER_HOST_LIMIT,
+            ttl_dns_cache=Config.HTTP_DNS_CACHE_TTL,
+            enable_cleanup_closed=True,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+        logger.info(
+            f"HTTP pool ready: {Config.HTTP_POOL_SIZE} connections, "
+            f"{Config.HTTP_PER_HOST_LIMIT} per host"
+        )
+    return _session
+
+
+async def start_http():
+    get_session()
+
+
+async def close_http():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,111 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import contextvars
+import os
+import shutil
+import time
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from plugins.functions.ran_text import random_char
+from plugins.functions.scheduler import background
+
+# The job the running task belongs to, visible to anything it awaits
+current_job = contextvars.ContextVar("current_job", default=None)
+
+# job id -> Job, only jobs that are still running
+registry = {}
+
+
+class Job:
+
+    def __init__(self, kind, user_id, title, on_cancel=None):
+        while True:
+            self.id = random_char(6)
+            if self.id not in registry:
+                break
+        self.kind = kind
+        self.user_id = user_id
+        self.title = title
+        self.stage = "queued"
+        self.started = time.time()
+        self.cancelled = False
+        self.paths = []
+        self.task = None
+        # Jobs that can stop gracefully (broadcasts) do it here instead of being cancelled
+        self.on_cancel = on_cancel
+
+    def cancel(self):
+        self.cancelled = True
+        if self.on_cancel is not None:
+            self.on_cancel()
+        elif self.task is not None:
+            self.task.cancel()
+
+    def cleanup(self):
+        for path in self.paths:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except Exception as e:
+                logger.error(f"Could not clean up {path}: {e}")
+
+    def describe(self):
+        age = int(time.time() - self.started)
+        return (
+            f"`{self.id}` • {self.kind} • {self.stage} • {age}s\n"
+            f"User: `{self.user_id}`\n"
+            f"{self.title}"
+        )
+
+
+def start_job(coro, kind, user_id, title, on_cancel=None):
+    """Run coro as a registered, cancellable background job"""
+    job = Job(kind, user_id, title, on_cancel)
+    registry[job.id] = job
+
+    async def run():
+        current_job.set(job)
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            logger.info(f"Job {job.id} ({job.kind}) cancelled")
+            job.cleanup()
+        finally:
+            registry.pop(job.id, None)
+
+    job.task = background(run())
+    return job
+
+
+def get_job(job_id):
+    return registry.get(job_id)
+
+
+def list_jobs(user_id=None):
+    return [job for job in registry.values() if user_id is None or job.user_id == user_id]
+
+
+def set_stage(stage):
+    job = current_job.get()
+    if job is not None:
+        job.stage = stage
+
+
+def track_path(path):
+    """Remove path if the current job gets cancelled"""
+    job = current_job.get()
+    if job is not None:
+        job.paths.append(path)
+
+
+def cancel_markup():
+    """Cancel button for the current job's status message"""
+    job = current_job.get()
+    if job is None:
+        return None
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton('⛔ Cancel', callback_data=f"cancel_download+{job.id}")]]
+    )
@@ -0,0 +1,132 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import html
+from pyrogram import enums
+from pyrogram.errors import FloodWait
+from plugins.config import Config
+
+
+class LogShipper:
+    """Collects log channel entries and posts them several to a message.
+
+    ship() never waits: past half the queue only every LOG_SAMPLE_RATE-th
+    entry is kept and a full queue drops entries, the next message says how
+    many were left out.
+    """
+
+    def __init__(self, chat_id, size):
+        self.chat_id = chat_id
+        self.queue = asyncio.Queue(size)
+        self.worker = None
+        self.offered = 0
+        self.sent = 0
+        self.dropped = 0
+        self.sampled = 0
+        self._skipped = 0
+        # An entry that didn't fit the last message, it starts the next one
+        self._carry = None
+
+    def start(self, bot):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.ensure_future(self._run(bot))
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    def ship(self, text):
+        if not self.chat_id:
+            return
+        self.offered += 1
+        if self.queue.qsize() >= self.queue.maxsize // 2 and self.offered % Config.LOG_SAMPLE_RATE:
+            self.sampled += 1
+            self._skipped += 1
+            return
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._skipped += 1
+
+    async def _batch(self):
+        if self._carry is not None:
+            entries = [self._carry]
+            self._carry = None
+        else:
+            entries = [await self.queue.get()]
+        length = len(entries[0])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.LOG_BATCH_INTERVAL
+        while len(entries) < Config.LOG_BATCH_SIZE:
+            try:
+                entry = await asyncio.wait_for(self.queue.get(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            if length + len(entry) + 2 > Config.MAX_MESSAGE_LENGTH - 100:
+                self._carry = entry
+                break
+            entries.append(entry)
+            length += len(entry) + 2
+        return entries
+
+    async def _run(self, bot):
+        while True:
+            entries = await self._batch()
+            text = "\n\n".join(entries)
+            if self._skipped:
+                text += f"\n\n<i>{self._skipped} entries skipped under load</i>"
+                self._skipped = 0
+            await self._send(bot, text[:Config.MAX_MESSAGE_LENGTH])
+            self.sent += len(entries)
+
+    async def _send(self, bot, text):
+        for attempt in range(Config.DOWNLOAD_RETRIES):
+            try:
+                await bot.send_message(
+                    self.chat_id,
+                    text,
+                    parse_mode=enums.ParseMode.HTML,
+                    disable_web_page_preview=True
+                )
+                return
+            except FloodWait as e:
+                logger.info(f"Log channel flood wait, {e.value}s")
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                logger.error(f"Posting to the log channel failed: {e}")
+                await asyncio.sleep(2 ** attempt)
+        logger.error("Giving up on a log channel batch")
+
+    def stats(self):
+        return dict(
+            queued=self.queue.qsize(),
+            sent=self.sent,
+            sampled=self.sampled,
+            dropped=self.dropped
+        )
+
+
+shipper = LogShipper(Config.LOG_CHANNEL, Config.LOG_QUEUE_SIZE)
+
+
+def ship(text):
+    """Queue an HTML entry for the log channel, returns at once"""
+    shipper.ship(text)
+
+
+def user_entry(tag, user, text=None):
+    """Log channel entry about user, with the text they sent"""
+    name = html.escape(user.first_name or "")
+    entry = (
+        f"{tag}\n"
+        f"Name: <a href='tg://user?id={user.id}'>{name}</a>\n"
+        f"User ID: <code>{user.id}</code>\n"
+        f"Username: @{user.username or ''}"
+    )
+    if text:
+        entry += f"\n{html.escape(text[:500])}"
+    return entry
@@ -0,0 +1,119 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from plugins.config import Config
+from plugins.database.database import db
+from plugins.functions.ytdl_cache import normalize_url
+
+# cache key -> Telegram file_id, in front of the Mongo collection
+_cache = OrderedDict()
+
+MEDIA_TYPES = ("video_note", "audio", "video", "document")
+
+
+def url_key(url, format_id, send_type):
+    return f"url:{normalize_url(url)}|{format_id}|{send_type}"
+
+
+def hash_key(digest, send_type):
+    return f"sha256:{digest}|{send_type}"
+
+
+def send_type_of(tg_send_type, upload_as_doc):
+    """What the upload code actually sends for a button, which is what a cached copy must match"""
+    if tg_send_type in ("audio", "vm"):
+        return tg_send_type
+    return "video" if upload_as_doc else "document"
+
+
+async def shareable(user_id):
+    """False when the user's uploads carry their own thumbnail or caption, those aren't shared"""
+    user = await db.get_user_data(user_id) or {}
+    return not user.get('thumbnail') and not user.get('caption')
+
+
+def _hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+async def file_digest(path):
+    """sha256 of a downloaded file, read off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, _hash_file, path)
+
+
+async def get_file_id(key):
+    file_id = _cache.get(key)
+    if file_id is not None:
+        _cache.move_to_end(key)
+        return file_id
+    try:
+        file_id = await db.get_media(key)
+    except Exception as e:
+        logger.error(f"Media cache lookup failed: {e}")
+        return None
+    if file_id is not None:
+        _remember(key, file_id)
+    return file_id
+
+
+async def remember(keys, message):
+    """Store the file_id of an uploaded message under every key that leads to it"""
+    file_id = None
+    for media_type in MEDIA_TYPES:
+        media = getattr(message, media_type, None)
+        if media is not None:
+            file_id = media.file_id
+            break
+    if file_id is None:
+        return
+    for key in keys:
+        if key is None:
+            continue
+        _remember(key, file_id)
+        try:
+            await db.set_media(key, file_id)
+        except Exception as e:
+            logger.error(f"Media cache store failed: {e}")
+
+
+async def forget(key):
+    _cache.pop(key, None)
+    try:
+        await db.delete_media(key)
+    except Exception as e:
+        logger.error(f"Media cache delete failed: {e}")
+
+
+async def send_cached(bot, update, key, caption, other_keys=()):
+    """Re-send the cached copy for key, returns False when there is none or it no longer works"""
+    file_id = await get_file_id(key)
+    if file_id is None:
+        return False
+    try:
+        sent = await bot.send_cached_media(
+            chat_id=update.message.chat.id,
+            file_id=file_id,
+            caption=caption
+        )
+    except Exception as e:
+        logger.info(f"Cached file_id for {key} failed, uploading again: {e}")
+        await forget(key)
+        return False
+    logger.info(f"Sent {key} from the media cache")
+    if other_keys:
+        await remember(other_keys, sent)
+    return True
+
+
+def _remember(key, file_id):
+    _cache[key] = file_id
+    _cache.move_to_end(key)
+    while len(_cache) > Config.MEDIA_CACHE_SIZE:
+        _cache.popitem(last=False)
@@ -0,0 +1,114 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+
+# (path, mtime, size) -> probe result, the same file is probed once per upload at most
+_cache = OrderedDict()
+CACHE_SIZE = 256
+
+
+def empty_info():
+    return dict(width=0, height=0, duration=0, video_codec=None, audio_codec=None, format=None, streams=[])
+
+
+def _rotation(stream):
+    rotate = stream.get("tags", {}).get("rotate")
+    if rotate is None:
+        for side_data in stream.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotate = side_data["rotation"]
+    try:
+        return abs(int(float(rotate or 0))) % 180
+    except ValueError:
+        return 0
+
+
+def parse_ffprobe(data):
+    """Turn `ffprobe -of json -show_format -show_streams` output into a probe result"""
+    info = empty_info()
+    info["streams"] = data.get("streams", [])
+    info["format"] = data.get("format", {}).get("format_name")
+    duration = data.get("format", {}).get("duration")
+    for stream in info["streams"]:
+        codec_type = stream.get("codec_type")
+        if codec_type == "video" and info["video_codec"] is None:
+            if stream.get("disposition", {}).get("attached_pic"):
+                continue
+            info["video_codec"] = stream.get("codec_name")
+            info["width"] = stream.get("width") or 0
+            info["height"] = stream.get("height") or 0
+            # Telegram wants the size as displayed
+            if _rotation(stream) == 90:
+                info["width"], info["height"] = info["height"], info["width"]
+            duration = duration or stream.get("duration")
+        elif codec_type == "audio" and info["audio_codec"] is None:
+            info["audio_codec"] = stream.get("codec_name")
+            duration = duration or stream.get("duration")
+    try:
+        info["duration"] = int(float(duration or 0))
+    except ValueError:
+        pass
+    return info
+
+
+async def _ffprobe(path):
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-of", "json", "-show_format", "-show_streams", path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise ValueError(stderr.decode().strip() or f"ffprobe exited with {process.returncode}")
+    return parse_ffprobe(json.loads(stdout or b"{}"))
+
+
+def _hachoir(path):
+    # Only used when ffprobe isn't installed, slow on big files so it runs on a thread
+    from hachoir.metadata import extractMetadata
+    from hachoir.parser import createParser
+    info = empty_info()
+    parser = createParser(path)
+    if parser is None:
+        return info
+    with parser:
+        metadata = extractMetadata(parser)
+    if metadata is not None:
+        if metadata.has("duration"):
+            info["duration"] = metadata.get("duration").seconds
+        if metadata.has("width"):
+            info["width"] = metadata.get("width")
+        if metadata.has("height"):
+            info["height"] = metadata.get("height")
+    return info
+
+
+async def probe(path):
+    """width, height, duration (seconds), codecs and streams of a media file, never blocks the loop.
+
+    Unreadable files give zeros, the same as hachoir finding no metadata did.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return empty_info()
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    try:
+        try:
+            info = await _ffprobe(path)
+        except FileNotFoundError:
+            info = await asyncio.get_running_loop().run_in_executor(None, _hachoir, path)
+    except Exception as e:
+        logger.info(f"Probing {path} failed: {e}")
+        info = empty_info()
+    _cache[key] = info
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return info
@@ -0,0 +1,151 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import time
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from plugins.config import Config
+from plugins.database.database import db
+from plugins.functions.forcesub import handle_force_subscribe, membership, MEMBER
+from plugins.functions.log_shipper import ship, user_entry
+from plugins.functions.verify import check_verification, get_token
+
+
+class StageStats:
+    """Latency and rejections per pre-flight stage, for /status"""
+
+    def __init__(self):
+        self.count = {}
+        self.total = {}
+        self.worst = {}
+        self.rejected = {}
+
+    def record(self, stage, seconds):
+        self.count[stage] = self.count.get(stage, 0) + 1
+        self.total[stage] = self.total.get(stage, 0) + seconds
+        self.worst[stage] = max(self.worst.get(stage, 0), seconds)
+
+    def reject(self, stage):
+        self.rejected[stage] = self.rejected.get(stage, 0) + 1
+
+    def summary(self):
+        if not self.count:
+            return "no messages yet"
+        return ", ".join(
+            f"{stage} {self.total[stage] / self.count[stage] * 1000:.1f}ms avg/"
+            f"{self.worst[stage] * 1000:.0f}ms max, {self.rejected.get(stage, 0)} rejected"
+            for stage in self.count
+        )
+
+
+stage_stats = StageStats()
+
+
+async def _timed(stage, coro):
+    started = time.monotonic()
+    result = await coro
+    # Checks cancelled by an earlier rejection are left out
+    stage_stats.record(stage, time.monotonic() - started)
+    return stage, result
+
+
+# A gating check returns None to let the message through, or a coroutine
+# function that tells the user why not. Only the rejection that wins gets to reply.
+
+async def _add_user(bot, update):
+    if await db.ensure_user(update.from_user.id):
+        ship(user_entry("#NewUser", update.from_user))
+
+
+async def _verification(bot, update):
+    if await check_verification(bot, update.from_user.id):
+        return None
+    return _verify_prompt
+
+
+def _verify_markup(url):
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("✓⃝ Vᴇʀɪꜰʏ ✓⃝", url=url)
+        ],[
+        InlineKeyboardButton("🔆 Wᴀᴛᴄʜ Hᴏᴡ Tᴏ Vᴇʀɪꜰʏ 🔆", url=f"{Config.VERIFICATION}")
+    ]])
+
+
+async def _verify_prompt(bot, update):
+    prompt = asyncio.get_running_loop().create_future()
+
+    async def on_ready(url):
+        # The short link wasn't ready when the prompt went out, put it in now
+        try:
+            message = await asyncio.wait_for(asyncio.shield(prompt), 60)
+            if url is None:
+                await message.edit_text("<b>Cᴏᴜʟᴅɴ'ᴛ Pʀᴇᴘᴀʀᴇ Yᴏᴜʀ Vᴇʀɪꜰʏ Lɪɴᴋ, Sᴇɴᴅ Yᴏᴜʀ Lɪɴᴋ Aɢᴀɪɴ Iɴ A Mɪɴᴜᴛᴇ</b>")
+            else:
+                await message.edit_text("<b>Pʟᴇᴀsᴇ Vᴇʀɪꜰʏ Fɪʀsᴛ Tᴏ Usᴇ Mᴇ</b>", reply_markup=_verify_markup(url))
+        except Exception as e:
+            logger.error(f"Updating the verify prompt failed: {e}")
+
+    url = await get_token(bot, update.from_user.id, on_ready)
+    if url is None:
+        try:
+            prompt.set_result(await update.reply_text(
+                text="<b>Pʀᴇᴘᴀʀɪɴɢ Yᴏᴜʀ Vᴇʀɪꜰʏ Lɪɴᴋ, Oɴᴇ Mᴏᴍᴇɴᴛ...</b>",
+                protect_content=True
+            ))
+        except BaseException:
+            prompt.cancel()
+            raise
+        return
+    await update.reply_text(
+        text="<b>Pʟᴇᴀsᴇ Vᴇʀɪꜰʏ Fɪʀsᴛ Tᴏ Usᴇ Mᴇ</b>",
+        protect_content=True,
+        reply_markup=_verify_markup(url)
+    )
+
+
+async def _force_subscribe(bot, update):
+    try:
+        if await membership(bot, update.from_user.id) == MEMBER:
+            return None
+    except Exception:
+        # handle_force_subscribe asks again and tells the user what went wrong
+        pass
+    return handle_force_subscribe
+
+
+async def preflight(bot, update):
+    """Run the checks in front of echo together, True when the message may go on.
+
+    The first check to reject cancels the others and sends its reply, so a
+    user gets one answer. Registering the user runs alongside but is never
+    cancelled, rejected users are still added. Per-stage timings end up in
+    stage_stats.
+    """
+    started = time.monotonic()
+    register = asyncio.ensure_future(_timed("user", _add_user(bot, update)))
+    checks = []
+    if update.from_user.id != Config.OWNER_ID and Config.TRUE_OR_FALSE:
+        checks.append(_timed("verify", _verification(bot, update)))
+    if Config.UPDATES_CHANNEL:
+        checks.append(_timed("forcesub", _force_subscribe(bot, update)))
+    tasks = [asyncio.ensure_future(check) for check in checks]
+    rejection = None
+    try:
+        for done in asyncio.as_completed(tasks):
+            stage, reject = await done
+            if reject is not None:
+                rejection = stage, reject
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+    # Done before any reply, the verify prompt registers the user too
+    await register
+    stage_stats.record("checks", time.monotonic() - started)
+    if rejection is not None:
+        stage, reject = rejection
+        stage_stats.reject(stage)
+        await reject(bot, update)
+        return False
+    ship(user_entry("#Link", update.from_user, update.text))
+    return True
@@ -0,0 +1,159 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import time
+from pyrogram.errors import FloodWait, MessageNotModified
+from plugins.config import Config
+
+
+class TokenBucket:
+    """Bot-wide edit budget. A FloodWait pauses every caller, not just the unlucky one."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+bucket = TokenBucket(Config.PROGRESS_EDITS_PER_SECOND, Config.PROGRESS_EDITS_BURST)
+
+
+class _Editor:
+    """Latest-wins edits for one status message, at most one per PROGRESS_INTERVAL"""
+
+    def __init__(self, client, chat_id, message_id):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.pending = None
+        self.sent = None
+        self.final = False
+        self.last_edit = 0
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def push(self, text, kwargs, final=False):
+        self.pending = (text, kwargs)
+        self.final = self.final or final
+        if final:
+            self.wake.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+        return self.task
+
+    async def cancel(self):
+        """Drop whatever is queued and wait out an edit already on its way"""
+        self.pending = None
+        self.final = True
+        self.wake.set()
+        if self.task is not None and not self.task.done():
+            await self.task
+
+    async def _run(self):
+        while self.pending is not None:
+            wait = self.last_edit + Config.PROGRESS_INTERVAL - time.time()
+            if wait > 0 and not self.final:
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            if self.pending[0] == self.sent:
+                self.pending = None
+                continue
+            await bucket.acquire()
+            if self.pending is None:
+                # Cancelled while waiting for the bucket
+                break
+            # Take the newest text only now, more may have arrived while waiting
+            text, kwargs = self.pending
+            self.pending = None
+            try:
+                await self.client.edit_message_text(self.chat_id, self.message_id, text, **kwargs)
+                self.sent = text
+            except MessageNotModified:
+                self.sent = text
+            except FloodWait as e:
+                logger.info(f"FloodWait {e.value}s on progress edit")
+                bucket.pause(e.value)
+                if self.pending is None:
+                    self.pending = (text, kwargs)
+            except Exception as e:
+                logger.info(f"Progress edit failed: {e}")
+            self.last_edit = time.time()
+        key = (self.chat_id, self.message_id)
+        if self.final and _editors.get(key) is self:
+            del _editors[key]
+
+
+_editors = {}
+
+
+def _editor(client, chat_id, message_id):
+    key = (chat_id, message_id)
+    if key not in _editors:
+        if len(_editors) > 1000:
+            _prune()
+        _editors[key] = _Editor(client, chat_id, message_id)
+    return _editors[key]
+
+
+def _prune():
+    idle_since = time.time() - 600
+    for key, editor in list(_editors.items()):
+        if (editor.task is None or editor.task.done()) and editor.last_edit < idle_since:
+            del _editors[key]
+
+
+def push_progress(client, chat_id, message_id, text, **kwargs):
+    """Queue a progress text for a message, returns at once.
+
+    Updates that arrive faster than PROGRESS_INTERVAL are coalesced and only
+    the newest one is sent, unchanged text is never sent twice.
+    """
+    _editor(client, chat_id, message_id).push(text, kwargs)
+
+
+async def finish_progress(client, chat_id, message_id, text, **kwargs):
+    """Deliver the final state of a status message, waiting for it to land"""
+    await _editor(client, chat_id, message_id).push(text, kwargs, final=True)
+
+
+async def cancel_progress(client, chat_id, message_id):
+    """Call before editing a status message directly, so no queued progress lands on top of it"""
+    editor = _editors.pop((chat_id, message_id), None)
+    if editor is not None:
+        await editor.cancel()
+
+
+def push_message_progress(message, text, **kwargs):
+    push_progress(message._client, message.chat.id, message.id, text, **kwargs)
+
+
+async def finish_message_progress(message, text, **kwargs):
+    await finish_progress(message._client, message.chat.id, message.id, text, **kwargs)
+
+
+async def cancel_message_progress(message):
+    await cancel_progress(message._client, message.chat.id, message.id)
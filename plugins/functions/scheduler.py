@@ -0,0 +1,123 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import contextlib
+import itertools
+from collections import Counter
+from plugins.config import Config
+from plugins.script import Translation
+
+
+class _Waiter:
+
+    def __init__(self, user_id, priority, order):
+        self.user_id = user_id
+        self.priority = priority
+        self.order = order
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class JobScheduler:
+    """Admission control for downloads, uploads and other heavy work.
+
+    At most `slots` jobs run at once and at most `per_user` of them belong to
+    the same user. Waiters are served first come first served, the owner goes
+    to the front of the line, and a user at their own limit never holds up the
+    people queued behind them.
+    """
+
+    def __init__(self, slots, per_user):
+        self.slots = slots
+        self.per_user = per_user
+        self.running = 0
+        self.running_by_user = Counter()
+        self.waiters = []
+        self._order = itertools.count()
+
+    def _can_run(self, user_id):
+        return self.running < self.slots and self.running_by_user[user_id] < self.per_user
+
+    def _grant(self, user_id):
+        self.running += 1
+        self.running_by_user[user_id] += 1
+
+    def _dispatch(self):
+        for waiter in list(self.waiters):
+            if self.running >= self.slots:
+                break
+            if self._can_run(waiter.user_id):
+                self.waiters.remove(waiter)
+                self._grant(waiter.user_id)
+                waiter.future.set_result(True)
+
+    def position(self, waiter):
+        return self.waiters.index(waiter) + 1 if waiter in self.waiters else 0
+
+    async def acquire(self, user_id, on_queued=None):
+        waiter = _Waiter(user_id, user_id == Config.OWNER_ID, next(self._order))
+        self.waiters.append(waiter)
+        self.waiters.sort(key=lambda w: (not w.priority, w.order))
+        self._dispatch()
+        shown = None
+        try:
+            while not waiter.future.done():
+                position = self.position(waiter)
+                if on_queued is not None and position != shown:
+                    shown = position
+                    try:
+                        await on_queued(position)
+                    except Exception as e:
+                        logger.info(f"Queue notice failed: {e}")
+                await asyncio.wait({waiter.future}, timeout=Config.QUEUE_REFRESH_INTERVAL)
+        except BaseException:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            elif waiter.future.done():
+                self.release(user_id)
+            raise
+
+    def release(self, user_id):
+        self.running -= 1
+        self.running_by_user[user_id] -= 1
+        if self.running_by_user[user_id] <= 0:
+            del self.running_by_user[user_id]
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user_id, on_queued=None):
+        await self.acquire(user_id, on_queued)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    def stats(self):
+        return dict(running=self.running, queued=len(self.waiters), slots=self.slots)
+
+
+scheduler = JobScheduler(Config.MAX_RUNNING_JOBS, Config.MAX_JOBS_PER_USER)
+
+# Strong references so running jobs are not garbage collected mid-flight
+_background = set()
+
+
+def background(coro):
+    """Run a job without holding up Pyrogram's handler workers while it queues"""
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_job_done)
+    return task
+
+
+def _job_done(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background job failed", exc_info=task.exception())
+
+
+def queue_notice(message):
+    """on_queued callback that shows the queue position in a status message"""
+    async def on_queued(position):
+        await message.edit(Translation.QUEUED.format(position))
+    return on_queued
@@ -0,0 +1,218 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import hashlib
+import math
+import mimetypes
+import aiohttp
+from pyrogram import raw, types, utils
+from pyrogram.errors import FloodWait
+from pyrogram.session import Session
+from plugins.config import Config
+from plugins.functions.downloader import supports_ranges
+
+# Telegram's upload part size, and the size above which parts go through SaveBigFilePart
+PART_SIZE = 512 * 1024
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+
+class StreamUpload:
+    """Upload a file to Telegram part by part while its bytes are still arriving.
+
+    write() blocks once STREAM_BUFFER_PARTS parts are waiting, so a fast
+    download is held back to the speed of the upload instead of piling up
+    in memory.
+    """
+
+    def __init__(self, client, file_size, file_name, progress=None, progress_args=()):
+        self.client = client
+        self.file_size = file_size
+        self.file_name = file_name
+        self.progress = progress
+        self.progress_args = progress_args
+        self.file_id = client.rnd_id()
+        self.total_parts = math.ceil(file_size / PART_SIZE)
+        self.queue = asyncio.Queue(Config.STREAM_BUFFER_PARTS)
+        self.buffer = bytearray()
+        self.part = 0
+        self.uploaded = 0
+        self.error = None
+        self.sha256 = hashlib.sha256()
+        self.session = None
+        self.workers = []
+
+    async def start(self):
+        self.session = Session(
+            self.client,
+            await self.client.storage.dc_id(),
+            await self.client.storage.auth_key(),
+            await self.client.storage.test_mode(),
+            is_media=True
+        )
+        await self.session.start()
+        self.workers = [
+            asyncio.ensure_future(self._worker()) for _ in range(Config.STREAM_UPLOAD_WORKERS)
+        ]
+
+    async def write(self, chunk):
+        self.sha256.update(chunk)
+        self.buffer += chunk
+        while len(self.buffer) >= PART_SIZE:
+            await self._put(bytes(self.buffer[:PART_SIZE]))
+            del self.buffer[:PART_SIZE]
+
+    async def _put(self, data):
+        if self.error is not None:
+            raise self.error
+        await self.queue.put((self.part, data))
+        self.part += 1
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                if item is None:
+                    return
+                # After a failure keep draining so write() never blocks on a dead upload
+                if self.error is None:
+                    await self._save_part(*item)
+            finally:
+                self.queue.task_done()
+
+    async def _save_part(self, index, data):
+        rpc = raw.functions.upload.SaveBigFilePart(
+            file_id=self.file_id,
+            file_part=index,
+            file_total_parts=self.total_parts,
+            bytes=data
+        )
+        for attempt in range(Config.DOWNLOAD_RETRIES):
+            try:
+                await self.session.invoke(rpc)
+                break
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                if attempt == Config.DOWNLOAD_RETRIES - 1:
+                    self.error = e
+                    return
+                logger.info(f"Part {index} of {self.file_name} failed ({e}), retrying")
+                await asyncio.sleep(attempt + 1)
+        else:
+            # Every attempt ended in a FloodWait, the part never made it
+            self.error = RuntimeError(f"Part {index} of {self.file_name} hit a FloodWait on every attempt")
+            return
+        self.uploaded += len(data)
+        if self.progress:
+            await self.progress(self.uploaded, self.file_size, *self.progress_args)
+
+    async def finish(self):
+        """Flush the last part and return the InputFile for messages.SendMedia"""
+        if self.buffer:
+            await self._put(bytes(self.buffer))
+            self.buffer.clear()
+        await self.queue.join()
+        if self.error is not None:
+            raise self.error
+        if self.part != self.total_parts:
+            raise ValueError(f"Got {self.part} parts of {self.file_name}, expected {self.total_parts}")
+        return raw.types.InputFileBig(id=self.file_id, parts=self.total_parts, name=self.file_name)
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.session is not None:
+            await self.session.stop()
+
+
+async def send_document(client, chat_id, upload, caption, thumb=None, parse_mode=None):
+    """Send a finished StreamUpload as a document, returns the Message like send_document"""
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mimetypes.guess_type(upload.file_name)[0] or "application/octet-stream",
+        file=await upload.finish(),
+        thumb=await client.save_file(thumb) if thumb else None,
+        attributes=[raw.types.DocumentAttributeFilename(file_name=upload.file_name)]
+    )
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=media,
+            random_id=client.rnd_id(),
+            **await utils.parse_text_entities(client, caption, parse_mode, None)
+        )
+    )
+    for i in r.updates:
+        if isinstance(i, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, i.message,
+                {i.id: i for i in r.users},
+                {i.id: i for i in r.chats}
+            )
+
+
+async def _body(session, url, response, ranged, headers, ssl):
+    """Chunks of the response body, picking up with a Range request if the stream drops"""
+    offset = 0
+    retries = 0
+    current = response
+    try:
+        while True:
+            try:
+                async for chunk in current.content.iter_chunked(PART_SIZE):
+                    offset += len(chunk)
+                    yield chunk
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not ranged or retries >= Config.DOWNLOAD_RETRIES:
+                    raise
+                retries += 1
+                logger.info(f"Stream of {url} dropped at {offset} ({e}), reconnecting")
+                await asyncio.sleep(retries)
+                if current is not response:
+                    current.release()
+                current = await session.get(
+                    url,
+                    headers=dict(headers or {}, Range=f"bytes={offset}-"),
+                    timeout=aiohttp.ClientTimeout(total=Config.PROCESS_MAX_TIMEOUT, sock_read=60),
+                    ssl=ssl
+                )
+                if current.status != 206:
+                    raise aiohttp.ClientResponseError(
+                        current.request_info, current.history, status=current.status
+                    )
+    finally:
+        if current is not response:
+            current.release()
+
+
+async def stream_to_telegram(client, session, url, chat_id, file_name, caption, thumb=None,
+                             parse_mode=None, progress=None, progress_args=(), headers=None, ssl=True):
+    """Download url and upload it as a document in a single pass.
+
+    Returns (message, sha256 hex digest), or None without reading the body
+    when the response can't be streamed and the caller should download to
+    disk as before.
+    """
+    async with session.get(
+        url,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=Config.PROCESS_MAX_TIMEOUT, sock_read=60),
+        ssl=ssl
+    ) as response:
+        total_length = int(response.headers.get("Content-Length", 0))
+        content_type = response.headers.get("Content-Type", "")
+        if (response.status != 200 or "text" in content_type
+                or not BIG_FILE_SIZE < total_length <= Config.TG_MAX_FILE_SIZE):
+            return None
+        logger.info(f"Streaming {url} straight to Telegram, {total_length} bytes")
+        upload = StreamUpload(client, total_length, file_name, progress, progress_args)
+        try:
+            await upload.start()
+            async for chunk in _body(session, url, response, supports_ranges(response), headers, ssl):
+                await upload.write(chunk)
+            message = await send_document(client, chat_id, upload, caption, thumb, parse_mode)
+        finally:
+            await upload.close()
+    return message, upload.sha256.hexdigest()
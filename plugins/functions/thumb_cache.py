@@ -0,0 +1,88 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from PIL import Image
+from plugins.config import Config
+from plugins.functions.ran_text import random_char
+
+THUMB_DIR = os.path.join(Config.DOWNLOAD_LOCATION, "thumbs")
+
+# Telegram wants a JPEG of at most 320px on the long side for document and video thumbnails
+THUMB_SIZE = (320, 320)
+
+# thumbnail file_id -> ready to upload JPEG, least recently used first
+_cache = None
+
+
+def _path_of(file_id):
+    return os.path.join(THUMB_DIR, hashlib.sha1(file_id.encode()).hexdigest() + ".jpg")
+
+
+def _entries():
+    global _cache
+    if _cache is None:
+        # Pick up what earlier runs left behind, oldest first, so the size bound covers it too
+        _cache = OrderedDict()
+        os.makedirs(THUMB_DIR, exist_ok=True)
+        files = [os.path.join(THUMB_DIR, name) for name in os.listdir(THUMB_DIR) if name.endswith(".jpg")]
+        for path in sorted(files, key=os.path.getmtime):
+            _cache[path] = path
+    return _cache
+
+
+def _normalize(source, target, temp):
+    with Image.open(source) as img:
+        img = img.convert("RGB")
+        img.thumbnail(THUMB_SIZE)
+        img.save(temp, "JPEG", quality=90)
+    os.replace(temp, target)
+
+
+async def get_thumb(bot, file_id):
+    """Local path of the thumbnail stored under file_id, downloading and resizing it only once"""
+    cache = _entries()
+    path = _path_of(file_id)
+    if path in cache and os.path.exists(path):
+        cache.move_to_end(path)
+        return path
+    # Two jobs of one user can fetch the same thumbnail at once, each works on its own
+    # temp files and the finished JPEG is swapped into place
+    temp = f"{path}.{random_char(8)}"
+    raw_path = await bot.download_media(message=file_id, file_name=temp + ".src")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _normalize, raw_path, path, temp + ".tmp")
+    finally:
+        _remove(raw_path)
+        _remove(temp + ".tmp")
+    cache[path] = path
+    cache.move_to_end(path)
+    while len(cache) > Config.THUMB_CACHE_SIZE:
+        _remove(cache.popitem(last=False)[0])
+    return path
+
+
+def forget_thumb(file_id):
+    """Drop the cached copy of a thumbnail the user replaced or deleted"""
+    if file_id is None:
+        return
+    path = _path_of(file_id)
+    _entries().pop(path, None)
+    _remove(path)
+
+
+def release_thumb(path):
+    """Clean up a thumbnail after an upload, cached ones are kept for the next upload"""
+    if not path or os.path.dirname(os.path.abspath(path)) == os.path.abspath(THUMB_DIR):
+        return
+    _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,126 +1,221 @@
+import logging
+logger = logging.getLogger(__name__)
+
 import asyncio
-from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
-from pyrogram.errors import FloodWait, UserIsBlocked, MessageNotModified, PeerIdInvalid
-from typing import Union
-import pytz
-import random 
-import re
-import os
-from datetime import datetime, date
+import random
 import string
-from typing import List
+import time
+from collections import OrderedDict
+from datetime import datetime, date, timedelta, timezone
 from plugins.database.database import db
-import requests
-import aiohttp
-import json
 from plugins.config import Config
+from plugins.functions.http_client import get_session
+from plugins.functions.scheduler import background
+from plugins.functions.log_shipper import ship
+
+
+# user id -> (unix time the answer is good until, verified), in front of db.verified
+_verified = OrderedDict()
 
+# user id -> VerifyLink still usable for the next verify prompt
+_links = OrderedDict()
+_shorten_queue = None
+_shorten_worker = None
 
-TOKENS = {}
-VERIFIED = {}
+START_LINK = f"https://telegram.me/{Config.BOT_USERNAME}?start="
 
 LOG_TEXT_P = """#NewUser
 ID - <code>{}</code>
 Name - {}"""
 
 
-async def get_verify_shorted_link(link):
-    API = Config.SHORT_API
+def _api_url():
+    # SHORT_DOMAIN may carry its own scheme, e.g. http://127.0.0.1:8080 for a local stub
     URL = Config.SHORT_DOMAIN
-    https = link.split(":")[0]
-    if "http" == https:
-        https = "https"
-        link = link.replace("http", https)
-
-    if URL == "api.shareus.in":
-        url = f"https://{URL}/shortLink"
-        params = {"token": API,
-                  "format": "json",
-                  "link": link,
-                  }
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, raise_for_status=True, ssl=False) as response:
-                    data = await response.json(content_type="text/html")
-                    if data["status"] == "success":
-                        return data["shortlink"]
-                    else:
-                        logger.error(f"Error: {data['message']}")
-                        return f'https://{URL}/shortLink?token={API}&format=json&link={link}'
+    base = URL if "://" in URL else f"https://{URL}"
+    if URL.endswith("api.shareus.in"):
+        return f"{base}/shortLink"
+    return f"{base}/api"
 
-        except Exception as e:
-            logger.error(e)
-            return f'https://{URL}/shortLink?token={API}&format=json&link={link}'
-    else:
-        url = f'https://{URL}/api'
-        params = {'api': API,
-                  'url': link,
-                  }
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, raise_for_status=True, ssl=False) as response:
-                    data = await response.json()
-                    if data["status"] == "success":
-                        return data['shortenedUrl']
-                    else:
-                        logger.error(f"Error: {data['message']}")
-                        return f'https://{URL}/api?api={API}&link={link}'
 
-        except Exception as e:
-            logger.error(e)
-            return f'{URL}/api?api={API}&link={link}'
-
-async def check_token(bot, userid, token):
-    user = await bot.get_users(userid)
-    if not await db.is_user_exist(user.id):
-        await db.add_user(user.id, user.first_name)
-        await bot.send_message(Config.LOG_CHANNEL, LOG_TEXT_P.format(user.id, user.mention))
-    if user.id in TOKENS.keys():
-        TKN = TOKENS[user.id]
-        if token in TKN.keys():
-            is_used = TKN[token]
-            if is_used == True:
-                return False
-            else:
-                return True
+async def shorten(link):
+    """Ask the shortener for a short link, raises when it doesn't give one"""
+    API = Config.SHORT_API
+    if Config.SHORT_DOMAIN.endswith("api.shareus.in"):
+        params = {"token": API, "format": "json", "link": link}
+        field = "shortlink"
     else:
-        return False
+        params = {"api": API, "url": link}
+        field = "shortenedUrl"
+    session = get_session()
+    async with session.get(_api_url(), params=params, raise_for_status=True, ssl=False) as response:
+        # shareus answers JSON as text/html
+        data = await response.json(content_type=None)
+    if data.get("status") != "success":
+        raise ValueError(data.get("message", data))
+    return data[field]
+
+
+def _end_of_day():
+    # Verification lasts until the coming local midnight, like the old date comparison
+    return datetime.combine(date.today() + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+def _to_utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _from_utc(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _remember(userid, until, verified):
+    _verified[userid] = (until, verified)
+    _verified.move_to_end(userid)
+    while len(_verified) > Config.VERIFY_CACHE_SIZE:
+        _verified.popitem(last=False)
+
+
+async def load_verifications():
+    """Fill the cache with everyone verified today, run once at startup"""
+    count = 0
+    async for entry in db.get_verified_users():
+        _remember(entry['_id'], _from_utc(entry['expires_at']), True)
+        count += 1
+    logger.info(f"Loaded {count} verified users")
+
+
+async def _register(bot, userid):
+    if await db.ensure_user(userid):
+        ship(LOG_TEXT_P.format(userid, f"<a href='tg://user?id={userid}'>{userid}</a>"))
 
-async def get_token(bot, userid, link):
-    user = await bot.get_users(userid)
-    if not await db.is_user_exist(user.id):
-        await db.add_user(user.id, user.first_name)
-        await bot.send_message(Config.LOG_CHANNEL, LOG_TEXT_P.format(user.id, user.mention))
+
+class VerifyLink:
+    def __init__(self, token, long_url, until):
+        self.token = token
+        self.long_url = long_url
+        self.until = until
+        # Without a shortener the deep link is the verify link, with one it is never shown
+        self.url = None if Config.SHORT_DOMAIN else long_url
+        self.pending = False
+        # Called with the short link, or None when shortening failed
+        self.waiters = []
+
+
+def _cached_link(userid):
+    entry = _links.get(userid)
+    # Don't hand out a link that runs out before the user gets to click it
+    if entry is None or entry.until - Config.SHORTLINK_MARGIN < time.time():
+        _links.pop(userid, None)
+        return None
+    _links.move_to_end(userid)
+    return entry
+
+
+async def _new_link(userid, link):
     token = ''.join(random.choices(string.ascii_letters + string.digits, k=7))
-    TOKENS[user.id] = {token: False}
-    link = f"{link}verify-{user.id}-{token}"
-    shortened_verify_url = await get_verify_shorted_link(link)
-    return str(shortened_verify_url)
+    await db.set_verify_token(userid, token, Config.VERIFY_TOKEN_TTL)
+    entry = VerifyLink(token, f"{link}verify-{userid}-{token}", time.time() + Config.VERIFY_TOKEN_TTL)
+    _links[userid] = entry
+    _links.move_to_end(userid)
+    while len(_links) > Config.VERIFY_CACHE_SIZE:
+        _links.popitem(last=False)
+    return entry
+
+
+def _queue_shorten(userid, entry):
+    global _shorten_queue, _shorten_worker
+    if entry.url is not None or entry.pending:
+        return
+    if _shorten_queue is None:
+        _shorten_queue = asyncio.Queue(Config.SHORTLINK_QUEUE_SIZE)
+    if _shorten_worker is None or _shorten_worker.done():
+        _shorten_worker = asyncio.ensure_future(_shorten_loop())
+    try:
+        _shorten_queue.put_nowait((userid, entry))
+        entry.pending = True
+    except asyncio.QueueFull:
+        logger.info(f"Shortener queue full, no verify link for user {userid} yet")
+
+
+async def _shorten_loop():
+    while True:
+        userid, entry = await _shorten_queue.get()
+        try:
+            entry.url = await asyncio.wait_for(shorten(entry.long_url), Config.SHORTLINK_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Tried again the next time the user is asked to verify
+            logger.error(f"Shortening for {userid} failed: {e!r}")
+        finally:
+            entry.pending = False
+            _notify(entry)
+            _shorten_queue.task_done()
+
+
+def _notify(entry):
+    waiters, entry.waiters = entry.waiters, []
+    for on_ready in waiters:
+        background(on_ready(entry.url))
+
+
+async def prepare_token(bot, userid, link=START_LINK):
+    """Make sure a shortened link is waiting for the user's next verify prompt"""
+    userid = int(userid)
+    entry = _cached_link(userid) or await _new_link(userid, link)
+    _queue_shorten(userid, entry)
+    return entry
+
+
+async def get_token(bot, userid, on_ready, link=START_LINK):
+    """The user's short verify link, reused until it expires, never waits on the shortener.
+
+    Returns None while the link is still being shortened, on_ready is then
+    called with the link once it is ready, or with None if shortening failed.
+    """
+    userid = int(userid)
+    await _register(bot, userid)
+    entry = await prepare_token(bot, userid, link)
+    if entry.url is not None:
+        return entry.url
+    entry.waiters.append(on_ready)
+    if not entry.pending:
+        # The shortener queue is full
+        _notify(entry)
+    return None
+
 
 async def verify_user(bot, userid, token):
-    user = await bot.get_users(userid)
-    if not await db.is_user_exist(user.id):
-        await db.add_user(user.id, user.first_name)
-        await bot.send_message(Config.LOG_CHANNEL, LOG_TEXT_P.format(user.id, user.mention))
-    TOKENS[user.id] = {token: True}
-    tz = pytz.timezone('Asia/Kolkata')
-    today = date.today()
-    VERIFIED[user.id] = str(today)
+    """Use up the token and mark the user verified, False if the token was already used"""
+    userid = int(userid)
+    await _register(bot, userid)
+    if not await db.use_verify_token(userid, token):
+        return False
+    # The cached link holds the used token, have the next one shortened ahead of time
+    _links.pop(userid, None)
+    background(prepare_token(bot, userid))
+    until = _end_of_day()
+    await db.set_verified_until(userid, _to_utc(until))
+    _remember(userid, until, True)
+    return True
+
 
 async def check_verification(bot, userid):
-    user = await bot.get_users(userid)
-    if not await db.is_user_exist(user.id):
-        await db.add_user(user.id, user.first_name)
-        await bot.send_message(Config.LOG_CHANNEL, LOG_TEXT_P.format(user.id, user.mention))
-    tz = pytz.timezone('Asia/Tokyo')
-    today = date.today()
-    if user.id in VERIFIED.keys():
-        EXP = VERIFIED[user.id]
-        years, month, day = EXP.split('-')
-        comp = date(int(years), int(month), int(day))
-        if comp<today:
-            return False
-        else:
-            return True
-    else:
+    """Answered from memory for cached users, one db read otherwise"""
+    userid = int(userid)
+    now = time.time()
+    entry = _verified.get(userid)
+    if entry is not None and entry[0] > now:
+        _verified.move_to_end(userid)
+        return entry[1]
+    try:
+        until = await db.get_verified_until(userid)
+    except Exception as e:
+        logger.error(f"Verification lookup failed: {e}")
         return False
+    if until is not None:
+        _remember(userid, _from_utc(until), True)
+        return True
+    _remember(userid, now + Config.VERIFY_NEGATIVE_TTL, False)
+    return False
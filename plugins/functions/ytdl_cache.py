@@ -0,0 +1,73 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from plugins.config import Config
+from plugins.database.database import db
+
+# normalized url -> (expires_at, yt-dlp info dict)
+_cache = OrderedDict()
+
+# Query parameters that never change what yt-dlp extracts
+TRACKING_PARAMS = ("si", "feature", "fbclid", "gclid", "igshid", "pp")
+
+
+def normalize_url(url):
+    """Canonical form of a link so that trivially different copies share a cache entry"""
+    parts = urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    if netloc.startswith("m."):
+        netloc = netloc[2:]
+    path = parts.path
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith("utm_")
+    ]
+    if netloc == "youtu.be" and path.strip("/"):
+        query.insert(0, ("v", path.strip("/")))
+        netloc, path = "youtube.com", "/watch"
+    return urlunsplit(("https", netloc, path.rstrip("/") or "/", urlencode(sorted(query)), ""))
+
+
+async def get_cached_info(url):
+    """Return the cached yt-dlp info dict for url, or None"""
+    key = normalize_url(url)
+    now = time.time()
+    entry = _cache.get(key)
+    if entry is not None:
+        expires_at, info = entry
+        if expires_at > now:
+            _cache.move_to_end(key)
+            return info
+        _cache.pop(key, None)
+    if Config.YTDL_CACHE_MONGO:
+        try:
+            info = await db.get_ytdl_info(key)
+        except Exception as e:
+            logger.error(f"yt-dlp cache lookup failed: {e}")
+            info = None
+        if info is not None:
+            _remember(key, info, now)
+            return info
+    return None
+
+
+async def cache_info(url, info):
+    key = normalize_url(url)
+    _remember(key, info, time.time())
+    if Config.YTDL_CACHE_MONGO:
+        try:
+            await db.set_ytdl_info(key, info, Config.YTDL_CACHE_TTL)
+        except Exception as e:
+            logger.error(f"yt-dlp cache store failed: {e}")
+
+
+def _remember(key, info, now):
+    _cache[key] = (now + Config.YTDL_CACHE_TTL, info)
+    _cache.move_to_end(key)
+    while len(_cache) > Config.YTDL_CACHE_SIZE:
+        _cache.popitem(last=False)
@@ -0,0 +1,144 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from plugins.config import Config
+
+
+class YtdlError(Exception):
+    """yt-dlp failed, the message is what the CLI would have printed to stderr"""
+
+
+def _worker_main(conn):
+    # Runs in the child: pay the yt-dlp import and extractor loading once
+    import yt_dlp
+    from yt_dlp.extractor import gen_extractor_classes
+    list(gen_extractor_classes())
+    while True:
+        try:
+            kind, argv = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            parsed = yt_dlp.parse_options(argv)
+            # The CLI defaults to ignoreerrors="only_download", which turns a failed
+            # download into a bare exit code, raise so the real message gets back
+            opts = dict(parsed.ydl_opts, quiet=True, noprogress=True, ignoreerrors=False)
+            if kind == "probe":
+                # -j would print the JSON, we hand it back instead
+                opts.pop("forcejson", None)
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                if kind == "probe":
+                    info = ydl.extract_info(parsed.urls[0], download=False)
+                    result = ("ok", ydl.sanitize_info(info))
+                else:
+                    retcode = ydl.download(parsed.urls)
+                    result = ("ok", None) if retcode == 0 else ("error", f"yt-dlp exited with {retcode}")
+        except BaseException as e:
+            result = ("error", str(e))
+        conn.send(result)
+
+
+class _Worker:
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    async def run(self, kind, argv, executor):
+        self.conn.send((kind, argv))
+        loop = asyncio.get_running_loop()
+        status, payload = await loop.run_in_executor(executor, self.conn.recv)
+        if status == "error":
+            raise YtdlError(payload)
+        return payload
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+
+
+class YtdlPool:
+    """Long-lived yt-dlp worker processes fed from a bounded queue.
+
+    A job that times out or is cancelled takes its worker down with it, the
+    worker is replaced so the pool size stays the same.
+    """
+
+    def __init__(self, size, queue_size):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.size = size
+        self.queue_size = queue_size
+        self.waiting = 0
+        self.idle = asyncio.Queue()
+        # One blocked recv() per busy worker
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ytdl")
+        for _ in range(size):
+            self.idle.put_nowait(_Worker(self.ctx))
+
+    async def submit(self, kind, argv, timeout=None):
+        if self.waiting >= self.queue_size:
+            raise YtdlError("Too many requests are waiting, please try again in a minute.")
+        self.waiting += 1
+        try:
+            worker = await self.idle.get()
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.wait_for(
+                worker.run(kind, argv, self.executor),
+                timeout or Config.PROCESS_MAX_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.info(f"Replacing yt-dlp worker {worker.process.pid} after a timed out {kind}")
+            worker.kill()
+            # Callers only handle YtdlError, a timeout is just another failure to them
+            raise YtdlError("timed out")
+        except (asyncio.CancelledError, EOFError, OSError):
+            logger.info(f"Replacing yt-dlp worker {worker.process.pid} after an aborted {kind}")
+            worker.kill()
+            raise
+        finally:
+            if not worker.alive():
+                worker = _Worker(self.ctx)
+            self.idle.put_nowait(worker)
+
+    def shutdown(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().kill()
+        self.executor.shutdown(wait=False)
+
+
+# Probes and downloads get separate workers so a long download never
+# delays the format list for someone who just pasted a link.
+_pools = {}
+
+
+def get_pool(kind):
+    if kind not in _pools:
+        size = Config.YTDL_PROBE_WORKERS if kind == "probe" else Config.YTDL_DOWNLOAD_WORKERS
+        _pools[kind] = YtdlPool(size, Config.YTDL_QUEUE_SIZE)
+    return _pools[kind]
+
+
+async def probe(argv, timeout=None):
+    """Equivalent of `yt-dlp -j <argv>`, returns the info dict"""
+    return await get_pool("probe").submit("probe", argv, timeout or Config.YTDL_PROBE_TIMEOUT)
+
+
+async def download(argv, timeout=None):
+    """Equivalent of running `yt-dlp <argv>`, raises YtdlError on failure"""
+    return await get_pool("download").submit("download", argv, timeout)
+
+
+async def close_ytdl():
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
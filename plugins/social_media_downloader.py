@@ -1,51 +1,92 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
 import yt_dlp
+import asyncio
+import functools
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from plugins.config import Config
 from plugins.functions.display_progress import progress_for_pyrogram
+from plugins.functions.progress_editor import push_message_progress, cancel_message_progress
 from datetime import datetime
 import time
 from plugins.dl_button import download_coroutine
+from plugins.functions.scheduler import scheduler, queue_notice
+from plugins.functions.jobs import start_job, current_job, cancel_markup
+
+logger = logging.getLogger(__name__)
 
 @Client.on_message(filters.private & filters.regex(r"https?://(?:www\.)?(?:pinterest\.com|twitter\.com|instagram\.com|reddit\.com)\S+"))
 async def social_media_downloader(bot, update):
-    await download_media(bot, update, update.text)
+    start_job(download_media(bot, update, update.text), "social", update.from_user.id, update.text)
+
+# extract_info blocks for the whole download, so it runs on these threads
+_executor = ThreadPoolExecutor(max_workers=Config.SOCIAL_DL_WORKERS, thread_name_prefix="social")
+
+
+def _run_ydl(url, ydl_opts):
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        return ydl.prepare_filename(info)
+
 
 async def download_media(bot, update, url):
     sent_message = await update.reply_text("Processing link...")
+    loop = asyncio.get_running_loop()
+    job = current_job.get()
+    markup = cancel_markup()
+
+    def hook(d):
+        # Runs on the yt-dlp thread, the edit itself is scheduled on the loop
+        if job is not None:
+            if job.cancelled:
+                # A thread can't be cancelled, so stop yt-dlp from inside its own hook
+                raise yt_dlp.utils.DownloadCancelled()
+            for key in ('tmpfilename', 'filename'):
+                if d.get(key) and d[key] not in job.paths:
+                    job.paths.append(d[key])
+        text = progress_text(d)
+        if text:
+            loop.call_soon_threadsafe(
+                functools.partial(push_message_progress, sent_message, text, reply_markup=markup)
+            )
 
     ydl_opts = {
         'outtmpl': os.path.join(Config.DOWNLOAD_LOCATION, '%(title)s.%(ext)s'),
-        'progress_hooks': [lambda d: on_progress(d, bot, sent_message)],
+        'progress_hooks': [hook],
     }
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    async with scheduler.slot(update.from_user.id, queue_notice(sent_message)):
         try:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
+            future = loop.run_in_executor(_executor, _run_ydl, url, ydl_opts)
+            filename = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Let the hook stop the thread before the job removes its partial files
+            await asyncio.wait({future}, timeout=30)
+            raise
+        except Exception as e:
+            await cancel_message_progress(sent_message)
+            await sent_message.edit(f"Error: {e}")
+            return
 
-            # Upload the downloaded file
+        # Upload the downloaded file
+        try:
             await upload_file(bot, update, filename, sent_message)
         except Exception as e:
+            await cancel_message_progress(sent_message)
             await sent_message.edit(f"Error: {e}")
 
-progress_times = {}
-
-async def on_progress(d, bot, message):
-    message_id = message.id
-    if d['status'] == 'downloading':
-        if message_id not in progress_times:
-            progress_times[message_id] = 0
 
-        current_time = time.time()
-        if current_time - progress_times[message_id] > 2:
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-            if total_bytes:
-                downloaded_bytes = d.get('downloaded_bytes')
-                percentage = downloaded_bytes * 100 / total_bytes
-                await message.edit(f"Downloading: {int(percentage)}%")
-            progress_times[message_id] = current_time
+def progress_text(d):
+    if d.get('status') != 'downloading':
+        return None
+    total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+    if not total_bytes:
+        return None
+    downloaded_bytes = d.get('downloaded_bytes') or 0
+    percentage = downloaded_bytes * 100 / total_bytes
+    return f"Downloading: {int(percentage)}%"
 
 async def upload_file(bot, update, filename, sent_message):
     start_time = time.time()
@@ -61,6 +102,5 @@ async def upload_file(bot, update, filename, sent_message):
         )
     )
     os.remove(filename)
+    await cancel_message_progress(sent_message)
     await sent_message.delete()
-    if sent_message.id in progress_times:
-        del progress_times[sent_message.id]
@@ -9,13 +9,114 @@ import os
 import re
 import logging
 from plugins.functions.display_progress import humanbytes, progress_for_pyrogram
+from plugins.functions.downloader import segmented_download, supports_ranges, validators_of, SEGMENT_CHUNK
+from plugins.functions.http_client import get_session
+from plugins.functions.progress_editor import push_message_progress, finish_message_progress, cancel_message_progress
+from plugins.functions.scheduler import scheduler, queue_notice
+from plugins.functions.stream_upload import stream_to_telegram
+from plugins.functions.jobs import start_job, cancel_markup, set_stage, track_path
 from plugins.thumbnail import Gthumb01, Mdata01, Gthumb02
-from urllib.parse import unquote
+from collections import Counter, OrderedDict
+from urllib.parse import unquote, quote, urlsplit, parse_qsl
 
 # Set up logging
 logger = logging.getLogger(__name__)
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 
+# Files per share page, sub folder levels followed, and link lookups in flight per share
+LIST_PAGE_SIZE = 100
+MAX_FOLDER_DEPTH = 5
+RESOLVE_CONCURRENCY = 5
+# A cached dlink is dropped this long before Terabox says it expires
+LINK_MARGIN = 300
+
+# Terabox answers the same API on all of its mirror domains
+TERABOX_HOSTS = [
+    "www.terabox.com",
+    "www.1024tera.com",
+    "www.terabox.app",
+    "www.4funbox.com",
+    "www.mirrobox.com",
+    "www.nephobox.com",
+    "www.freeterabox.com",
+]
+# Latency assumed for an endpoint that hasn't answered yet
+DEFAULT_LATENCY = 2.0
+
+
+class EndpointStats:
+    """Latency and success record per endpoint, so the fast and reliable ones are tried first"""
+
+    def __init__(self):
+        self.latency = {}
+        self.success = Counter()
+        self.failure = Counter()
+
+    def record(self, endpoint, ok, elapsed):
+        if ok:
+            self.success[endpoint] += 1
+            previous = self.latency.get(endpoint, elapsed)
+            self.latency[endpoint] = 0.7 * previous + 0.3 * elapsed
+        else:
+            self.failure[endpoint] += 1
+
+    def score(self, endpoint):
+        # Expected time to a good answer, unknown endpoints get a fair chance
+        tries = self.success[endpoint] + self.failure[endpoint]
+        success_rate = (self.success[endpoint] + 1) / (tries + 2)
+        return self.latency.get(endpoint, DEFAULT_LATENCY) / success_rate
+
+    def ranked(self, candidates):
+        return sorted(candidates, key=lambda candidate: self.score(candidate[0]))
+
+    def summary(self, limit=3):
+        best = sorted(set(self.success) | set(self.failure), key=self.score)[:limit]
+        return ", ".join(
+            f"{endpoint} {self.latency.get(endpoint, 0):.1f}s {self.success[endpoint]}/{self.success[endpoint] + self.failure[endpoint]}"
+            for endpoint in best
+        ) or "no requests yet"
+
+
+endpoint_stats = EndpointStats()
+
+# surl -> share listing and (surl, fs_id) -> dlink, each as (expires_at, value)
+_shares = OrderedDict()
+_links = OrderedDict()
+# share url -> surl, saves the redirect fetch for links without the surl in them
+_surls = OrderedDict()
+
+
+def _cache_get(cache, key):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at <= time.time():
+        cache.pop(key, None)
+        return None
+    cache.move_to_end(key)
+    return value
+
+
+def _cache_put(cache, key, value, ttl):
+    cache[key] = (time.time() + ttl, value)
+    cache.move_to_end(key)
+    while len(cache) > Config.TERABOX_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def dlink_ttl(dlink):
+    """Seconds a dlink can still be handed out, from its time/expires parameters when it has them"""
+    query = dict(parse_qsl(urlsplit(dlink).query))
+    ttl = Config.TERABOX_LINK_TTL
+    match = re.fullmatch(r'(\d+)([smhd]?)', query.get('expires', ''))
+    if match:
+        seconds = int(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        issued = int(query['time']) if query.get('time', '').isdigit() else time.time()
+        ttl = min(ttl, issued + seconds - time.time())
+    return ttl - LINK_MARGIN
+
+
 class TeraboxDownloader:
     def __init__(self, cookie=None):
         self.cookie = cookie
@@ -28,6 +129,8 @@ class TeraboxDownloader:
         }
         if self.cookie:
             self.headers['Cookie'] = f'ndus={self.cookie}'
+        # Mirror that answered the share listing, later pages are asked there too
+        self.host = TERABOX_HOSTS[0]
 
     async def extract_surl(self, url):
         """Extract surl from various Terabox URL formats"""
@@ -44,136 +147,266 @@ class TeraboxDownloader:
 
         # Try to fetch and extract from redirect
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, allow_redirects=True, timeout=10) as response:
-                    final_url = str(response.url)
-                    for pattern in patterns:
-                        match = re.search(pattern, final_url)
-                        if match:
-                            return match.group(1)
+            session = get_session()
+            async with session.get(url, allow_redirects=True, timeout=10) as response:
+                final_url = str(response.url)
+                for pattern in patterns:
+                    match = re.search(pattern, final_url)
+                    if match:
+                        return match.group(1)
         except:
             pass
 
         return None
 
-    async def get_file_info(self, surl):
-        """Get file information from Terabox"""
-        # Try different API endpoints
-        apis = [
-            f'https://www.terabox.com/share/list?app_id=250528&web=1&channel=dubox&clienttype=0&jsToken=&dp-logid=&page=1&num=20&by=name&order=asc&site_referer=&shorturl={surl}&root=1',
-            f'https://www.terabox.com/api/shorturlinfo?shorturl={surl}&root=1',
-        ]
-
-        async with aiohttp.ClientSession() as session:
-            for api in apis:
-                try:
-                    async with session.get(api, headers=self.headers, timeout=15, ssl=False) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            logger.info(f"API Response: {data}")
-
-                            # Check different response formats
-                            if data.get('errno') == 0:
-                                # Format 1: list in response
-                                if 'list' in data and data['list']:
-                                    file_info = data['list'][0]
-                                    return {
-                                        'filename': file_info.get('server_filename', 'terabox_file'),
-                                        'size': file_info.get('size', 0),
-                                        'fs_id': file_info.get('fs_id'),
-                                        'uk': data.get('uk'),
-                                        'shareid': data.get('shareid'),
-                                        'timestamp': data.get('timestamp')
-                                    }
-                except Exception as e:
-                    logger.error(f"API {api} failed: {e}")
-                    continue
+    async def _fetch_json(self, api):
+        session = get_session()
+        async with session.get(api, headers=self.headers, timeout=15, ssl=False) as response:
+            if response.status != 200:
+                return None
+            return await response.json(content_type=None)
 
-        return None
+    async def _timed(self, endpoint, api, accept):
+        started = time.monotonic()
+        try:
+            data = await self._fetch_json(api)
+            ok = data is not None and accept(data)
+        except asyncio.CancelledError:
+            # Lost the race, that says nothing about the endpoint
+            raise
+        except Exception as e:
+            logger.info(f"Terabox endpoint {endpoint} failed: {e}")
+            ok = False
+        endpoint_stats.record(endpoint, ok, time.monotonic() - started)
+        return data if ok else None
+
+    async def _race(self, candidates, accept):
+        """Ask several (endpoint, url) candidates at once and keep the first accepted answer.
+
+        Candidates go out best first with TERABOX_HEDGE of them in flight, each
+        one that fails makes room for the next, and the ones still running when
+        an answer arrives are cancelled. Returns (endpoint, data) or (None, None).
+        """
+        waiting = iter(endpoint_stats.ranked(candidates))
+        tasks = {}
+
+        def launch():
+            for endpoint, api in waiting:
+                task = asyncio.ensure_future(self._timed(endpoint, api, accept))
+                tasks[task] = endpoint
+                return task
+            return None
 
-    async def get_download_link(self, file_info, surl):
-        """Get direct download link"""
         try:
-            # Method 1: Direct download API
-            download_api = f'https://www.terabox.com/share/download?surl={surl}&fid={file_info["fs_id"]}'
+            pending = set()
+            while len(pending) < Config.TERABOX_HEDGE:
+                task = launch()
+                if task is None:
+                    break
+                pending.add(task)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.result() is not None:
+                        return tasks[task], task.result()
+                    task = launch()
+                    if task is not None:
+                        pending.add(task)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return None, None
+
+    async def _list_pages(self, surl, where, first_page=None):
+        """Every entry of one share directory, following the pages"""
+        entries = list(first_page or [])
+        page = 2 if first_page is not None else 1
+        if first_page is not None and len(first_page) < LIST_PAGE_SIZE:
+            return entries
+        while len(entries) < Config.TERABOX_MAX_FILES:
+            api = f'https://{self.host}/share/list?app_id=250528&web=1&channel=dubox&clienttype=0&jsToken=&dp-logid=&page={page}&num={LIST_PAGE_SIZE}&by=name&order=asc&site_referer=&shorturl={surl}{where}'
+            data = await self._fetch_json(api)
+            if not data or data.get('errno') != 0:
+                break
+            entries += data.get('list', [])
+            if len(data.get('list', [])) < LIST_PAGE_SIZE:
+                break
+            page += 1
+        return entries
+
+    async def _collect(self, surl, entries, files, depth=0):
+        """Flatten a folder share into its files, walking into sub folders"""
+        for entry in entries:
+            if len(files) >= Config.TERABOX_MAX_FILES:
+                return
+            if str(entry.get('isdir')) == '1':
+                if depth < MAX_FOLDER_DEPTH and entry.get('path'):
+                    sub_entries = await self._list_pages(surl, f"&dir={quote(entry['path'], safe='')}")
+                    await self._collect(surl, sub_entries, files, depth + 1)
+                continue
+            files.append({
+                'filename': entry.get('server_filename', 'terabox_file'),
+                'size': int(entry.get('size', 0)),
+                'fs_id': entry.get('fs_id')
+            })
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(download_api, headers=self.headers, timeout=15, ssl=False) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get('errno') == 0 and data.get('dlink'):
-                            return data['dlink']
+    async def get_file_info(self, surl):
+        """Get the share and every file in it from Terabox"""
+        share = _cache_get(_shares, surl)
+        if share is not None:
+            return share
+
+        # Every listing endpoint on every mirror is a candidate
+        candidates = []
+        for host in TERABOX_HOSTS:
+            candidates.append((f"{host}/share/list", f'https://{host}/share/list?app_id=250528&web=1&channel=dubox&clienttype=0&jsToken=&dp-logid=&page=1&num={LIST_PAGE_SIZE}&by=name&order=asc&site_referer=&shorturl={surl}&root=1'))
+            candidates.append((f"{host}/api/shorturlinfo", f'https://{host}/api/shorturlinfo?shorturl={surl}&root=1'))
+
+        endpoint, data = await self._race(
+            candidates, lambda data: data.get('errno') == 0 and bool(data.get('list'))
+        )
+        if data is not None:
+            self.host = endpoint.split("/", 1)[0]
+            entries = data['list']
+            if endpoint.endswith('/share/list'):
+                entries = await self._list_pages(surl, "&root=1", entries)
+            share = {
+                'uk': data.get('uk'),
+                'shareid': data.get('shareid'),
+                'timestamp': data.get('timestamp'),
+                'host': self.host,
+                'files': []
+            }
+            await self._collect(surl, entries, share['files'])
+            if share['files']:
+                _cache_put(_shares, surl, share, Config.TERABOX_LINK_TTL)
+                return share
 
-                # Method 2: Try alternate API
-                alt_api = f'https://www.terabox.com/api/download?shareid={file_info["shareid"]}&uk={file_info["uk"]}&fid={file_info["fs_id"]}&timestamp={file_info["timestamp"]}'
+        return None
 
-                async with session.get(alt_api, headers=self.headers, timeout=15, ssl=False) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get('dlink'):
-                            return data['dlink']
+    async def get_download_link(self, share, file_info, surl):
+        """Get direct download link, reusing one resolved earlier while it is still valid"""
+        key = (surl, file_info['fs_id'])
+        dlink = _cache_get(_links, key)
+        if dlink is not None:
+            return dlink
+        try:
+            # Method 1: Direct download API, raced across the mirrors
+            endpoint, data = await self._race(
+                [
+                    (f"{host}/share/download", f'https://{host}/share/download?surl={surl}&fid={file_info["fs_id"]}')
+                    for host in TERABOX_HOSTS
+                ],
+                lambda data: data.get('errno') == 0 and bool(data.get('dlink'))
+            )
+            if data is not None:
+                dlink = data['dlink']
+            else:
+                # Method 2: Try alternate API
+                alt_api = f'https://{share.get("host", TERABOX_HOSTS[0])}/api/download?shareid={share["shareid"]}&uk={share["uk"]}&fid={file_info["fs_id"]}&timestamp={share["timestamp"]}'
+                data = await self._fetch_json(alt_api)
+                if data and data.get('dlink'):
+                    dlink = data['dlink']
         except Exception as e:
             logger.error(f"Failed to get download link: {e}")
 
-        return None
+        if dlink:
+            ttl = dlink_ttl(dlink)
+            if ttl > 0:
+                _cache_put(_links, key, dlink, ttl)
+        return dlink
 
     async def resolve(self, url):
-        """Main resolve method"""
+        """Resolve every file of a share, download links are fetched concurrently"""
         try:
-            surl = await self.extract_surl(url)
+            surl = _surls.get(url) or await self.extract_surl(url)
             if not surl:
                 return {'error': 'Could not extract surl from URL'}
+            _surls[url] = surl
+            while len(_surls) > Config.TERABOX_CACHE_SIZE:
+                _surls.popitem(last=False)
 
             logger.info(f"Extracted surl: {surl}")
 
-            file_info = await self.get_file_info(surl)
-            if not file_info:
+            share = await self.get_file_info(surl)
+            if not share:
                 return {'error': 'Could not fetch file information'}
 
-            logger.info(f"File info: {file_info}")
+            logger.info(f"Share {surl} has {len(share['files'])} files")
 
-            dlink = await self.get_download_link(file_info, surl)
-            if not dlink:
+            semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+            async def resolve_file(file_info):
+                async with semaphore:
+                    dlink = await self.get_download_link(share, file_info, surl)
+                return {
+                    'filename': file_info['filename'],
+                    'size': file_info['size'],
+                    'dlink': dlink
+                }
+
+            entries = await asyncio.gather(*[resolve_file(f) for f in share['files']])
+            files = [entry for entry in entries if entry['dlink']]
+            if not files:
                 return {'error': 'Could not get download link'}
 
-            return {
-                'filename': file_info['filename'],
-                'size': file_info['size'],
-                'dlink': dlink
-            }
+            return {'files': files, 'missing': len(entries) - len(files)}
         except Exception as e:
             logger.error(f"Resolution error: {e}", exc_info=True)
             return {'error': str(e)}
 
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+}
+
 
 async def download_file(session, url, file_path, progress_callback, message):
-    """Download file with progress tracking"""
+    """Download file with progress tracking, resuming from the journal when possible"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        }
+        headers = DOWNLOAD_HEADERS
 
         async with session.get(url, headers=headers, timeout=None, ssl=False) as response:
             if response.status != 200:
                 raise Exception(f"HTTP {response.status}")
 
             total_size = int(response.headers.get('content-length', 0))
+            ranged = supports_ranges(response)
+            validators = validators_of(response)
             downloaded = 0
             start_time = time.time()
 
-            with open(file_path, 'wb') as f:
-                async for chunk in response.content.iter_chunked(1024 * 1024):  # 1MB chunks
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-
-                        # Update progress every 2 seconds
-                        if time.time() - start_time > 2:
-                            if progress_callback:
-                                await progress_callback(downloaded, total_size, message)
-                            start_time = time.time()
-
-            return True
+            if not ranged:
+                with open(file_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(SEGMENT_CHUNK):
+                        if chunk:
+                            f.write(chunk)
+                            downloaded += len(chunk)
+
+                            # Update progress every 2 seconds
+                            if time.time() - start_time > 2:
+                                if progress_callback:
+                                    await progress_callback(downloaded, total_size, message)
+                                start_time = time.time()
+
+                return True
+
+        async def on_progress(current, total):
+            if progress_callback:
+                await progress_callback(current, total, message)
+
+        # dlinks change on every resolve, the journal matches them by ETag/Last-Modified
+        await segmented_download(
+            session,
+            url,
+            file_path,
+            total_size,
+            progress=on_progress,
+            interval=2,
+            headers=headers,
+            validators=validators,
+            ssl=False
+        )
+        return True
     except Exception as e:
         logger.error(f"Download error: {e}")
         return False
@@ -181,14 +414,15 @@ async def download_file(session, url, file_path, progress_callback, message):
 
 async def update_progress(current, total, message):
     """Update download progress"""
-    try:
-        percentage = (current * 100) / total if total > 0 else 0
-        text = f"📥 Downloading from Terabox...\n\n"
-        text += f"Progress: {percentage:.1f}%\n"
-        text += f"Downloaded: {humanbytes(current)} / {humanbytes(total)}"
-        await message.edit(text)
-    except:
-        pass
+    percentage = (current * 100) / total if total > 0 else 0
+    text = f"📥 Downloading from Terabox...\n\n"
+    text += f"Progress: {percentage:.1f}%\n"
+    text += f"Downloaded: {humanbytes(current)} / {humanbytes(total)}"
+    set_stage("downloading")
+    if total and current >= total:
+        await finish_message_progress(message, text)
+    else:
+        push_message_progress(message, text, reply_markup=cancel_markup())
 
 
 @Client.on_message(filters.private & filters.command("set_cookie"))
@@ -214,85 +448,151 @@ async def handle_cookie_reply(bot, update):
 
 @Client.on_message(filters.private & filters.regex(r"https?://(?:www\.)?(?:terabox\.com|terabox\.app|teraboxlink\.com|1024tera\.com|4funbox\.com|mirrobox\.com|nephobox\.com|freeterabox\.com|teraboxapp\.com|gibibox\.com)\S+"))
 async def terabox_downloader(bot, update):
+    start_job(process_terabox(bot, update), "terabox", update.from_user.id, update.text)
+
+
+async def process_terabox(bot, update):
     logger.info(f"Terabox link received from user {update.from_user.id}: {update.text}")
 
     sent_message = await update.reply_text("🔄 Processing Terabox link...")
 
-    try:
-        cookie = await db.get_terabox_cookie(update.from_user.id)
-        downloader = TeraboxDownloader(cookie)
+    async with scheduler.slot(update.from_user.id, queue_notice(sent_message)):
+        try:
+            cookie = await db.get_terabox_cookie(update.from_user.id)
+            downloader = TeraboxDownloader(cookie)
 
-        await sent_message.edit("🔍 Resolving link...")
+            await sent_message.edit("🔍 Resolving link...")
 
-        file_meta = await downloader.resolve(update.text)
+            file_meta = await downloader.resolve(update.text)
 
-        if 'error' in file_meta:
-            await sent_message.edit(f"❌ Error: {file_meta['error']}\n\nTry setting your cookie with /set_cookie")
-            return
+            if 'error' in file_meta:
+                await sent_message.edit(f"❌ Error: {file_meta['error']}\n\nTry setting your cookie with /set_cookie")
+                return
 
-        filename = file_meta['filename']
-        dlink = file_meta['dlink']
+            files = file_meta['files']
+            upload_as_doc = await db.get_upload_as_doc(update.from_user.id)
 
-        logger.info(f"Resolved: {filename}")
+            if len(files) == 1:
+                await transfer_file(bot, update, sent_message, files[0], upload_as_doc)
+                return
 
-        # Create download directory
-        tmp_dir = os.path.join(Config.DOWNLOAD_LOCATION, str(update.from_user.id))
-        os.makedirs(tmp_dir, exist_ok=True)
-        file_path = os.path.join(tmp_dir, filename)
+            # Folder share: the whole batch runs in this one slot, one status message per file
+            await sent_message.edit(f"📂 Found {len(files)} files, sending them one by one...")
+            failed = file_meta['missing']
+            for index, file_entry in enumerate(files, 1):
+                status = await update.reply_text(f"📄 {index}/{len(files)}: {file_entry['filename']}")
+                try:
+                    if not await transfer_file(bot, update, status, file_entry, upload_as_doc):
+                        failed += 1
+                except Exception as e:
+                    logger.error(f"Terabox error on {file_entry['filename']}: {e}", exc_info=True)
+                    await cancel_message_progress(status)
+                    await status.edit(f"❌ Error: {str(e)}")
+                    failed += 1
+            await sent_message.edit(
+                f"✅ Sent {len(files) + file_meta['missing'] - failed} of {len(files) + file_meta['missing']} files."
+            )
 
-        await sent_message.edit("📥 Downloading...")
+        except Exception as e:
+            logger.error(f"Terabox error: {e}", exc_info=True)
+            await cancel_message_progress(sent_message)
+            await sent_message.edit(f"❌ Error: {str(e)}")
 
-        # Download file
-        async with aiohttp.ClientSession() as session:
-            success = await download_file(session, dlink, file_path, update_progress, sent_message)
 
-        if not success or not os.path.exists(file_path):
-            await sent_message.edit("❌ Download failed!")
-            return
+async def transfer_file(bot, update, sent_message, file_meta, upload_as_doc):
+    """Download one resolved file and upload it, sent_message shows the progress.
 
-        # Upload to Telegram
-        await sent_message.edit("📤 Uploading to Telegram...")
-        start_time = time.time()
+    Returns False when the download failed.
+    """
+    filename = file_meta['filename']
+    dlink = file_meta['dlink']
 
-        upload_as_doc = await db.get_upload_as_doc(update.from_user.id)
+    logger.info(f"Resolved: {filename}")
 
-        try:
-            if not upload_as_doc:
-                thumbnail = await Gthumb01(bot, update)
-                await bot.send_document(
-                    chat_id=update.chat.id,
-                    document=file_path,
-                    thumb=thumbnail,
-                    caption=filename,
-                    progress=progress_for_pyrogram,
-                    progress_args=("Uploading...", sent_message, start_time)
-                )
-            else:
-                width, height, duration = await Mdata01(file_path)
-                thumb = await Gthumb02(bot, update, duration, file_path)
-                await bot.send_video(
-                    chat_id=update.chat.id,
-                    video=file_path,
-                    caption=filename,
-                    duration=duration,
-                    width=width,
-                    height=height,
-                    supports_streaming=True,
-                    thumb=thumb,
-                    progress=progress_for_pyrogram,
-                    progress_args=("Uploading...", sent_message, start_time)
-                )
+    # Create download directory
+    tmp_dir = os.path.join(Config.DOWNLOAD_LOCATION, str(update.from_user.id))
+    os.makedirs(tmp_dir, exist_ok=True)
+    file_path = os.path.join(tmp_dir, filename)
+    track_path(file_path)
 
+    session = get_session()
+
+    if Config.STREAM_UPLOAD and not upload_as_doc:
+        # Documents need nothing from the file itself, upload them as they download
+        set_stage("streaming")
+        await sent_message.edit("📤 Streaming to Telegram...")
+        try:
+            streamed = await stream_to_telegram(
+                bot,
+                session,
+                dlink,
+                update.chat.id,
+                filename,
+                filename,
+                thumb=await Gthumb01(bot, update),
+                progress=progress_for_pyrogram,
+                progress_args=("Uploading...", sent_message, time.time()),
+                headers=DOWNLOAD_HEADERS,
+                ssl=False
+            )
+        except Exception as e:
+            logger.error(f"Streaming {filename} failed, downloading first: {e}")
+            streamed = None
+        if streamed is not None:
+            await cancel_message_progress(sent_message)
             await sent_message.delete()
+            return True
 
-        finally:
-            # Cleanup
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
+    await cancel_message_progress(sent_message)
+    await sent_message.edit("📥 Downloading...")
 
-    except Exception as e:
-        logger.error(f"Terabox error: {e}", exc_info=True)
-        await sent_message.edit(f"❌ Error: {str(e)}")
\ No newline at end of file
+    # Download file
+    success = await download_file(session, dlink, file_path, update_progress, sent_message)
+
+    await cancel_message_progress(sent_message)
+    if not success or not os.path.exists(file_path):
+        await sent_message.edit("❌ Download failed!")
+        return False
+
+    # Upload to Telegram
+    await sent_message.edit("📤 Uploading to Telegram...")
+    start_time = time.time()
+
+    try:
+        if not upload_as_doc:
+            thumbnail = await Gthumb01(bot, update)
+            await bot.send_document(
+                chat_id=update.chat.id,
+                document=file_path,
+                thumb=thumbnail,
+                caption=filename,
+                progress=progress_for_pyrogram,
+                progress_args=("Uploading...", sent_message, start_time)
+            )
+        else:
+            width, height, duration = await Mdata01(file_path)
+            thumb = await Gthumb02(bot, update, duration, file_path)
+            await bot.send_video(
+                chat_id=update.chat.id,
+                video=file_path,
+                caption=filename,
+                duration=duration,
+                width=width,
+                height=height,
+                supports_streaming=True,
+                thumb=thumb,
+                progress=progress_for_pyrogram,
+                progress_args=("Uploading...", sent_message, start_time)
+            )
+
+        await cancel_message_progress(sent_message)
+        await sent_message.delete()
+        return True
+
+    finally:
+        # Cleanup
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except:
+            pass
@@ -18,11 +18,11 @@ import time
 from plugins.script import Translation
 from pyrogram import Client
 from plugins.database.add import AddUser
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 from pyrogram import filters
 from plugins.functions.help_Nekmo_ffmpeg import take_screen_shot
+from plugins.functions.thumb_cache import get_thumb, forget_thumb
+from plugins.functions.media_probe import probe
 import psutil
 import shutil
 import string
@@ -44,21 +44,17 @@ async def save_photo(bot, update):
       fsub = await handle_force_subscribe(bot, update)
       if fsub == 400:
         return
-    # received single photo
-    download_location = os.path.join(
-        Config.DOWNLOAD_LOCATION,
-        str(update.from_user.id) + ".jpg"
-    )
-    await bot.download_media(
-        message=update,
-        file_name=download_location
-    )
+    # received single photo, resized into the cache right away for the first upload
+    old_thumbnail = await db.get_thumbnail(update.from_user.id)
+    await get_thumb(bot, update.photo.file_id)
     await bot.send_message(
         chat_id=update.chat.id,
         text=Translation.SAVED_CUSTOM_THUMB_NAIL,
         #reply_to_message_id=update.id
     )
     await db.set_thumbnail(update.from_user.id, thumbnail=update.photo.file_id)
+    if old_thumbnail != update.photo.file_id:
+        forget_thumb(old_thumbnail)
 
 
 @Client.on_message(filters.command(["delthumb"]))
@@ -79,6 +75,7 @@ async def delete_thumbnail(bot, update):
         # os.remove(download_location + ".json")
     except:
         pass
+    forget_thumb(await db.get_thumbnail(update.from_user.id))
     await bot.send_message(
         chat_id=update.chat.id,
         text=Translation.DEL_ETED_CUSTOM_THUMB_NAIL,
@@ -109,25 +106,19 @@ async def viewthumbnail(bot, update):
 
 
 async def Gthumb01(bot, update):
-    thumb_image_path = f"{Config.DOWNLOAD_LOCATION}/{str(update.from_user.id)}.jpg"
     db_thumbnail = await db.get_thumbnail(update.from_user.id)
     if db_thumbnail is not None:
-        thumbnail = await bot.download_media(message=db_thumbnail, file_name=thumb_image_path)
-        Image.open(thumbnail).convert("RGB").save(thumbnail)
-        img = Image.open(thumbnail)
-        img.resize((100, 100))
-        img.save(thumbnail, "JPEG")
+        thumbnail = await get_thumb(bot, db_thumbnail)
     else:
         thumbnail = None
 
     return thumbnail
 
 async def Gthumb02(bot, update, duration, download_directory):
-    thumb_image_path = f"{Config.DOWNLOAD_LOCATION}/{str(update.from_user.id)}.jpg"
     db_thumbnail = await db.get_thumbnail(update.from_user.id)
     
     if db_thumbnail is not None:
-        return await bot.download_media(message=db_thumbnail, file_name=thumb_image_path)
+        return await get_thumb(bot, db_thumbnail)
     elif duration > 1:
         return await take_screen_shot(download_directory, os.path.dirname(download_directory), random.randint(0, duration - 1))
     else:
@@ -135,38 +126,15 @@ async def Gthumb02(bot, update, duration, download_directory):
         return None
 async def Mdata01(download_directory):
 
-          width = 0
-          height = 0
-          duration = 0
-          metadata = extractMetadata(createParser(download_directory))
-          if metadata is not None:
-              if metadata.has("duration"):
-                  duration = metadata.get('duration').seconds
-              if metadata.has("width"):
-                  width = metadata.get("width")
-              if metadata.has("height"):
-                  height = metadata.get("height")
-
-          return width, height, duration
+          info = await probe(download_directory)
+          return info["width"], info["height"], info["duration"]
 
 async def Mdata02(download_directory):
 
-          width = 0
-          duration = 0
-          metadata = extractMetadata(createParser(download_directory))
-          if metadata is not None:
-              if metadata.has("duration"):
-                  duration = metadata.get('duration').seconds
-              if metadata.has("width"):
-                  width = metadata.get("width")
-
-          return width, duration
+          info = await probe(download_directory)
+          return info["width"], info["duration"]
 
 async def Mdata03(download_directory):
 
-    metadata = extractMetadata(createParser(download_directory))
-    return (
-        metadata.get('duration').seconds
-        if metadata is not None and metadata.has("duration")
-        else 0
-    )
+    info = await probe(download_directory)
+    return info["duration"]